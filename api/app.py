@@ -1,32 +1,127 @@
-from flask import Flask, jsonify, request
-import pika
+from flask import Flask, g, jsonify, request, stream_with_context
+import base64
+import csv
+import io
 import json
-from pymongo import MongoClient, DESCENDING
+import os
+import re
+import sys
+import time
+from pymongo import ASCENDING, DESCENDING
+
+# Permite importar o pacote compartilhado 'common' (raiz do projeto)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import API_REQUEST_SECONDS, CONTENT_TYPE, ERRORS, MESSAGES, PUBLISH_SECONDS, REGISTRY
+from common.players import player_key
+from common.indexes import ensure_indexes
+from common.tracking import TRACKED_COLLECTION, track_requests
+from services.cache import LRUCache
+from services.db import get_database
+from services.mq import ChannelPool
+from services.percentiles import PopulationPercentiles
 
 app = Flask(__name__)
 
 # Configurações
-RABBITMQ_HOST = 'localhost'
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
+RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
 QUEUE_NAME = 'scraping_queue'
-MONGO_URI = 'mongodb://localhost:27017/'
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB = os.environ.get('MONGO_DB', 'bf_stats_db')
+API_PORT = int(os.environ.get('API_PORT', 5000))
+# Quantidade de canais de publicacao mantidos abertos (~ threads/requisicoes simultaneas)
+MQ_POOL_SIZE = int(os.environ.get('MQ_POOL_SIZE', 8))
+MQ_BATCH_POOL_SIZE = int(os.environ.get('MQ_BATCH_POOL_SIZE', 2))
+# Limite de jogadores aceitos por chamada em POST /analyze-players
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 5000))
+# Respostas do GET /player guardadas em memoria (por processo)
+PLAYER_CACHE_SIZE = int(os.environ.get('PLAYER_CACHE_SIZE', 10000))
+# De quanto em quanto tempo a API rele os sketches de percentis gravados pelo Analyzer
+SKETCH_REFRESH_SECONDS = float(os.environ.get('SKETCH_REFRESH_SECONDS', 60))
+# Maximo de pontos devolvidos pelo GET /player/<nome>/history sem resolution explicita (minimo 2)
+HISTORY_MAX_POINTS = max(2, int(os.environ.get('HISTORY_MAX_POINTS', 500)))
+HISTORY_DEFAULT_RANGE = 30 * 86400
+# Documentos lidos do MongoDB (e linhas enviadas) por vez no GET /export
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+# Tamanho padrao e maximo de uma pagina do GET /ranking
+RANKING_DEFAULT_TOP = 10
+RANKING_MAX_TOP = 100
+
+publisher_pool = ChannelPool(RABBITMQ_HOST, QUEUE_NAME, size=MQ_POOL_SIZE, virtual_host=RABBITMQ_VHOST)
+batch_publisher_pool = ChannelPool(RABBITMQ_HOST, QUEUE_NAME, size=MQ_BATCH_POOL_SIZE, transactional=True,
+                                    virtual_host=RABBITMQ_VHOST)
+# player_name -> (etag, corpo JSON)
+player_response_cache = LRUCache(PLAYER_CACHE_SIZE)
+_population = None
+
+def get_population():
+    global _population
+    if _population is None:
+        _population = PopulationPercentiles(
+            get_database(MONGO_URI, MONGO_DB)['population_sketches'], SKETCH_REFRESH_SECONDS
+        )
+    return _population
+
+def setup_indexes():
+    """
+    Cria os indices antes de aceitar requisicoes (a primeira consulta nao espera a criacao).
+    Roda ao carregar o modulo: vale para python app.py, flask run e cada worker do gunicorn.
+    """
+    print("Verificando indices do MongoDB...")
+    ensure_indexes(get_database(MONGO_URI, MONGO_DB))
+
+setup_indexes()
 
 def get_db_collection():
-    """Conecta ao banco e retorna a colecao de estatisticas"""
-    client = MongoClient(MONGO_URI)
-    db = client['bf_stats_db']
+    """Retorna a colecao de estatisticas usando o cliente compartilhado"""
+    db = get_database(MONGO_URI, MONGO_DB)
     return db['raw_player_stats']
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        # Usa a regra da rota (ex: /player/<string:player_name>) para nao explodir os labels
+        route = request.url_rule.rule if request.url_rule else 'nao_encontrada'
+        API_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method, route=route, status=str(response.status_code)
+        )
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Metricas no formato do Prometheus"""
+    return app.response_class(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route('/')
 def home():
     return jsonify({
         "status": "Online",
         "rotas": [
             "POST /analyze-player",
+            "POST /analyze-players",
             "GET /player/<nome>",
-            "GET /ranking"
+            "GET /player/<nome>/history?from=&to=&resolution=&platform=",
+            "GET /ranking?top=N&platform=&classification=&cursor=",
+            "GET /metrics",
+            "GET /export?format=ndjson|csv&scope=leaderboard|snapshots&platform=&classification=&since="
         ]
     })
 
+def track_players(players, now):
+    """Registra os jogadores pedidos para o Scheduler; uma falha aqui nao derruba o POST"""
+    try:
+        track_requests(get_database(MONGO_URI, MONGO_DB)[TRACKED_COLLECTION], players, now)
+    except Exception as e:
+        print(f"Aviso: falha ao registrar jogadores acompanhados: {e}")
+        ERRORS.inc(stage='tracking')
+
 # --- ROTA DE ENVIO (POST) ---
 @app.route('/analyze-player', methods=['POST'])
 def analyze_player():
@@ -39,67 +134,406 @@ def analyze_player():
     platform = data['platform']
 
     try:
-        connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
-        channel = connection.channel()
-        channel.queue_declare(queue=QUEUE_NAME, durable=True)
-
         task_payload = {
             "player_name": player_name,
             "platform": platform,
-            "status": "pendente"
+            "status": "pendente",
+            # Carimbo usado para medir a latencia ponta a ponta do pipeline
+            "enqueued_at": time.time()
         }
-        
-        channel.basic_publish(
-            exchange='',
-            routing_key=QUEUE_NAME,
-            body=json.dumps(task_payload),
-            properties=pika.BasicProperties(delivery_mode=2)
-        )
-        connection.close()
+
+        with PUBLISH_SECONDS.time(queue=QUEUE_NAME):
+            publisher_pool.publish(task_payload)
+        MESSAGES.inc(stage='enqueue', result='aceito')
+        track_players([(player_name, platform)], task_payload['enqueued_at'])
         return jsonify({"status": "Sucesso", "mensagem": f"Jogador {player_name} enviado para fila."}), 202
 
     except Exception as e:
+        ERRORS.inc(stage='publish')
         return jsonify({"status": "Erro", "detalhe": str(e)}), 500
 
+def validate_player_item(item):
+    """Valida um item do lote e retorna (player_name, platform, motivo_da_rejeicao)"""
+    if not isinstance(item, dict):
+        return None, None, "Item deve ser um objeto com player_name e platform."
+
+    player_name = item.get('player_name')
+    platform = item.get('platform')
+    if not isinstance(player_name, str) or not player_name.strip():
+        return player_name, platform, "Campo player_name invalido."
+    if not isinstance(platform, str) or not platform.strip():
+        return player_name, platform, "Campo platform invalido."
+
+    return player_name.strip(), platform.strip(), None
+
+# --- ROTA DE ENVIO EM LOTE (POST) ---
+@app.route('/analyze-players', methods=['POST'])
+def analyze_players():
+    """Enfileira varios jogadores de uma vez (ex: cla inteiro) em um unico canal"""
+    data = request.get_json(silent=True)
+    items = data.get('players') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "Erro", "mensagem": "Envie uma lista de {player_name, platform}."}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"status": "Erro", "mensagem": f"Lote maior que o limite de {MAX_BATCH_SIZE} jogadores."}), 413
+
+    resultados = []
+    payloads = []
+    accepted_results = []
+    seen = set()
+    enqueued_at = time.time()
+
+    for index, item in enumerate(items):
+        player_name, platform, motivo = validate_player_item(item)
+        resultado = {"indice": index, "player_name": player_name, "platform": platform}
+
+        if motivo is None:
+            key = (player_name.lower(), platform.lower())
+            if key in seen:
+                motivo = "Jogador duplicado no lote."
+            else:
+                seen.add(key)
+
+        if motivo:
+            resultado.update({"status": "rejeitado", "motivo": motivo})
+        else:
+            resultado["status"] = "aceito"
+            payloads.append({
+                "player_name": player_name,
+                "platform": platform,
+                "status": "pendente",
+                "enqueued_at": enqueued_at
+            })
+            accepted_results.append(resultado)
+        resultados.append(resultado)
+
+    committed, erro = 0, None
+    if payloads:
+        with PUBLISH_SECONDS.time(queue=QUEUE_NAME):
+            committed, erro = batch_publisher_pool.publish_batch(payloads)
+    if erro:
+        ERRORS.inc(stage='publish')
+    MESSAGES.inc(committed, stage='enqueue', result='aceito')
+    MESSAGES.inc(len(items) - committed, stage='enqueue', result='rejeitado')
+
+    track_players([(r['player_name'], r['platform']) for r in accepted_results[:committed]], enqueued_at)
+
+    # Itens depois do ultimo bloco confirmado nao chegaram ao broker
+    for resultado in accepted_results[committed:]:
+        resultado.update({"status": "rejeitado", "motivo": f"Falha ao publicar na fila: {erro}"})
+
+    aceitos = committed
+    resposta = {
+        "status": "Sucesso" if aceitos else "Erro",
+        "aceitos": aceitos,
+        "rejeitados": len(resultados) - aceitos,
+        "resultados": resultados
+    }
+    if erro and not aceitos:
+        return jsonify(resposta), 500
+    return jsonify(resposta), 202 if aceitos else 400
+
 # --- NOVAS ROTAS DE LEITURA (GET) ---
 
+def player_response(body, etag, status=200):
+    response = app.response_class(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
 @app.route('/player/<string:player_name>', methods=['GET'])
 def get_player(player_name):
-    """Busca os dados de um jogador especifico"""
+    """
+    Busca os dados mais recentes de um jogador especifico, com os percentis dele
+    na populacao da plataforma (ex: percentiles.kd_ratio = 93.1).
+    Responde com ETag; um If-None-Match igual recebe 304 sem corpo.
+    """
+    db = get_database(MONGO_URI, MONGO_DB)
     collection = get_db_collection()
-    
-    # Busca o documento mais recente desse jogador
-    # sort descendo pelo _id garante que pegamos o ultimo inserido
-    player_data = collection.find_one(
-        {"player_name": player_name},
-        sort=[('_id', DESCENDING)]
-    )
+    population = get_population()
+
+    # O ponteiro player_latest e mantido pelos workers: a versao sobe a cada
+    # snapshot novo e a cada analise concluida, invalidando o cache abaixo
+    pointer = db['player_latest'].find_one({"_id": player_name}, {"document_id": 1, "version": 1, "platform": 1})
+
+    if pointer:
+        sketch_version = population.version(pointer.get('platform'))
+        etag = f"{pointer['document_id']}-{pointer.get('version', 0)}-{sketch_version}"
+        if request.if_none_match.contains(etag):
+            return player_response(b'', etag, 304)
+
+        cached = player_response_cache.get(player_name)
+        if cached and cached[0] == etag:
+            return player_response(cached[1], etag)
 
-    if player_data:
-        # Convertendo o ObjectId para string para nao dar erro no JSON
-        player_data['_id'] = str(player_data['_id'])
-        return jsonify(player_data), 200
+        player_data = collection.find_one({"_id": pointer['document_id']})
     else:
+        # Jogadores salvos antes do ponteiro existir: busca o ultimo inserido
+        # pelo indice (player_name, _id)
+        player_data = collection.find_one(
+            {"player_name": player_name},
+            sort=[('_id', DESCENDING)]
+        )
+        etag = None
+
+    if not player_data:
         return jsonify({"status": "Erro", "mensagem": "Jogador nao encontrado ou ainda nao processado."}), 404
 
+    # Convertendo o ObjectId para string para nao dar erro no JSON
+    player_data['_id'] = str(player_data['_id'])
+
+    stats = player_data.get('stats', {})
+    sketch_version, player_data['percentiles'] = population.ranks(player_data.get('platform'), {
+        "kd_ratio": player_data.get('analysis', {}).get('kd_ratio'),
+        "accuracy_percent": stats.get('accuracy_percent'),
+        "time_played_hours": stats.get('time_played_hours')
+    })
+    body = jsonify(player_data).get_data()
+
+    if etag:
+        player_response_cache.put(player_name, (etag, body))
+    else:
+        etag = f"{player_data['_id']}-{player_data.get('analysis', {}).get('processed_at', 0)}-{sketch_version}"
+        if request.if_none_match.contains(etag):
+            return player_response(b'', etag, 304)
+
+    return player_response(body, etag)
+
+RESOLUTION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_resolution(value):
+    """'raw', segundos ('3600') ou duracao ('15m', '1h', '1d'); None = automatica"""
+    if value is None or value == 'raw':
+        return value
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhd]?)", value.strip())
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError("resolution invalida")
+    return float(match.group(1)) * RESOLUTION_UNITS[match.group(2) or "s"]
+
+def downsample(points, start, resolution):
+    """Um ponto por intervalo de 'resolution' segundos: o ultimo (contadores sao acumulados)"""
+    bins = {}
+    for point in points:
+        bins[int((point[0] - start) // resolution)] = point
+    return [bins[index] for index in sorted(bins)]
+
+@app.route('/player/<string:player_name>/history', methods=['GET'])
+def get_player_history(player_name):
+    """
+    Serie temporal do jogador (timestamps em epoch, como created_at), lida dos
+    buckets compactos de player_history e reduzida no servidor.
+    Parametros: from/to (padrao: ultimos 30 dias), resolution e platform
+    (padrao: plataforma do snapshot mais recente).
+    """
+    db = get_database(MONGO_URI, MONGO_DB)
+
+    platform = request.args.get('platform')
+    if not platform:
+        pointer = db['player_latest'].find_one({"_id": player_name}, {"platform": 1})
+        platform = pointer.get('platform') if pointer else None
+    if not platform:
+        return jsonify({"status": "Erro", "mensagem": "Jogador nao encontrado ou ainda nao processado."}), 404
+
+    try:
+        end = float(request.args.get('to', time.time()))
+        start = float(request.args.get('from', end - HISTORY_DEFAULT_RANGE))
+        resolution = parse_resolution(request.args.get('resolution'))
+    except ValueError:
+        return jsonify({"status": "Erro", "mensagem": "Parametros from/to/resolution invalidos."}), 400
+    if start > end:
+        return jsonify({"status": "Erro", "mensagem": "from deve ser menor que to."}), 400
+
+    buckets = db['player_history'].find(
+        {"player_key": player_key(player_name, platform), "start": {"$lte": end}, "end": {"$gte": start}},
+        {"t": 1, "kills": 1, "deaths": 1, "hours": 1, "accuracy": 1}
+    )
+
+    points = []
+    for bucket in buckets:
+        samples = zip(bucket['t'], bucket['kills'], bucket['deaths'], bucket['hours'], bucket['accuracy'])
+        points.extend(sample for sample in samples if start <= sample[0] <= end)
+    points.sort()
+
+    if resolution is None:
+        # Automatica: no maximo HISTORY_MAX_POINTS pontos no periodo que tem dados
+        span = points[-1][0] - points[0][0] if points else 0
+        if len(points) > HISTORY_MAX_POINTS and span > 0:
+            resolution = span / (HISTORY_MAX_POINTS - 1)
+            points = downsample(points, points[0][0], resolution)
+        else:
+            resolution = 'raw'
+    elif resolution != 'raw':
+        points = downsample(points, start, resolution)
+
+    return jsonify({
+        "player_name": player_name,
+        "platform": platform,
+        "from": start,
+        "to": end,
+        "resolution": resolution,
+        "points": len(points),
+        "series": {
+            "t": [point[0] for point in points],
+            "kills": [point[1] for point in points],
+            "deaths": [point[2] for point in points],
+            "kd_ratio": [round(point[1] / (point[2] or 1), 2) for point in points],
+            "time_played_hours": [point[3] for point in points],
+            "accuracy_percent": [point[4] for point in points]
+        }
+    }), 200
+
+def encode_cursor(doc):
+    """Cursor opaco com a posicao do ultimo item da pagina: (kd_ratio, _id)"""
+    raw = json.dumps([doc['analysis']['kd_ratio'], doc['_id']])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    kd_ratio, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(kd_ratio, (int, float)) or not isinstance(last_id, str):
+        raise ValueError("cursor invalido")
+    return kd_ratio, last_id
+
 @app.route('/ranking', methods=['GET'])
 def get_ranking():
-    """Retorna o TOP 10 jogadores baseado no KD Ratio"""
-    collection = get_db_collection()
-    
-    # Busca usuarios que ja tem analise feita (campo 'analysis' existe)
-    # Ordena por KD Ratio (decrescente: -1 ou DESCENDING)
-    # Limita a 10 resultados
-    top_players = collection.find(
-        {"analysis": {"$exists": True}}
-    ).sort("analysis.kd_ratio", DESCENDING).limit(10)
+    """
+    Retorna os TOP N jogadores (padrao 10) baseado no KD Ratio, lendo o ranking
+    materializado (uma entrada por jogador/plataforma) mantido pelo Analyzer.
+    Filtros opcionais: ?platform= e ?classification=.
+    Para a proxima pagina, envie ?cursor= com o valor do header X-Next-Cursor.
+    """
+    top = request.args.get('top', RANKING_DEFAULT_TOP, type=int)
+    if top is None or not 1 <= top <= RANKING_MAX_TOP:
+        return jsonify({"status": "Erro", "mensagem": f"top deve estar entre 1 e {RANKING_MAX_TOP}."}), 400
+
+    query = {}
+    if request.args.get('platform'):
+        query['platform'] = request.args['platform']
+    if request.args.get('classification'):
+        query['analysis.classification'] = request.args['classification']
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            kd_ratio, last_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({"status": "Erro", "mensagem": "Cursor invalido."}), 400
+        # Continua depois do ultimo item: KD menor, ou mesmo KD com _id maior
+        query['$or'] = [
+            {"analysis.kd_ratio": {"$lt": kd_ratio}},
+            {"analysis.kd_ratio": kd_ratio, "_id": {"$gt": last_id}}
+        ]
+
+    collection = get_database(MONGO_URI, MONGO_DB)['leaderboard']
+    # Buscamos um a mais para saber se existe proxima pagina
+    docs = list(
+        collection.find(query)
+        .sort([("analysis.kd_ratio", DESCENDING), ("_id", ASCENDING)])
+        .limit(top + 1)
+    )
+
+    next_cursor = encode_cursor(docs[top - 1]) if len(docs) > top else None
 
     lista_ranking = []
-    for doc in top_players:
-        doc['_id'] = str(doc['_id'])
+    for doc in docs[:top]:
+        doc['snapshot_id'] = str(doc['snapshot_id'])
         lista_ranking.append(doc)
 
-    return jsonify(lista_ranking), 200
+    response = jsonify(lista_ranking)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+EXPORT_COLUMNS = [
+    "player_name", "platform", "kills", "deaths", "wins", "losses", "accuracy_percent",
+    "time_played_hours", "headshots", "favorite_class", "kd_ratio", "classification",
+    "kd_7d", "kd_30d", "hours_7d", "hours_30d", "created_at", "processed_at"
+]
+EXPORT_PROJECTION = {"_id": 0, "player_name": 1, "platform": 1, "stats": 1, "analysis": 1, "created_at": 1}
+
+def export_row(doc):
+    """Linha plana (mesmas colunas no CSV e no NDJSON)"""
+    stats = doc.get('stats', {})
+    analysis = doc.get('analysis', {})
+    trends = analysis.get('trends') or {}
+    row = {"player_name": doc.get('player_name'), "platform": doc.get('platform')}
+    for field in ("kills", "deaths", "wins", "losses", "accuracy_percent",
+                  "time_played_hours", "headshots", "favorite_class"):
+        row[field] = stats.get(field)
+    row.update({
+        "kd_ratio": analysis.get('kd_ratio'),
+        "classification": analysis.get('classification'),
+        "kd_7d": trends.get('kd_7d'),
+        "kd_30d": trends.get('kd_30d'),
+        "hours_7d": trends.get('hours_7d'),
+        "hours_30d": trends.get('hours_30d'),
+        "created_at": doc.get('created_at'),
+        "processed_at": analysis.get('processed_at')
+    })
+    return row
+
+@app.route('/export', methods=['GET'])
+def export_players():
+    """
+    Exporta os jogadores analisados em streaming (memoria constante), em NDJSON
+    (padrao) ou CSV. scope=leaderboard (padrao) traz a analise mais recente de
+    cada jogador; scope=snapshots traz todo o historico analisado.
+    Filtros: platform, classification e since (analysis.processed_at >= since).
+    A saida e ordenada por processed_at: para exportar so o que mudou, use o
+    maior processed_at recebido como since da proxima vez.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    scope = request.args.get('scope', 'leaderboard')
+    if export_format not in ('ndjson', 'csv') or scope not in ('leaderboard', 'snapshots'):
+        return jsonify({"status": "Erro", "mensagem": "Use format=ndjson|csv e scope=leaderboard|snapshots."}), 400
+
+    try:
+        since = float(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"status": "Erro", "mensagem": "since deve ser um timestamp (epoch)."}), 400
+
+    query = {"analysis.processed_at": {"$gte": since}}
+    if request.args.get('platform'):
+        query['platform'] = request.args['platform']
+    if request.args.get('classification'):
+        query['analysis.classification'] = request.args['classification']
+
+    db = get_database(MONGO_URI, MONGO_DB)
+    collection = db['leaderboard'] if scope == 'leaderboard' else db['raw_player_stats']
+
+    def generate():
+        cursor = (
+            collection.find(query, EXPORT_PROJECTION)
+            .sort("analysis.processed_at", ASCENDING)
+            .batch_size(EXPORT_BATCH_SIZE)
+        )
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS) if export_format == 'csv' else None
+        if writer:
+            writer.writeheader()
+
+        try:
+            rows = 0
+            for doc in cursor:
+                row = export_row(doc)
+                if writer:
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(row) + "\n")
+                rows += 1
+                # Envia em blocos para nao acumular a exportacao inteira em memoria
+                if rows % EXPORT_BATCH_SIZE == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            cursor.close()
+
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f"attachment; filename=players_{scope}.{export_format}"
+    return response
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(debug=os.environ.get('FLASK_ENV', 'development') == 'development',
+            port=API_PORT, threaded=True)
\ No newline at end of file
@@ -0,0 +1,19 @@
+import threading
+from pymongo import MongoClient
+
+# Um unico MongoClient por processo: ele ja mantem seu proprio pool
+# de conexoes e e seguro para uso entre threads.
+_client = None
+_client_lock = threading.Lock()
+
+def get_client(mongo_uri):
+    """Retorna o MongoClient compartilhado, criando-o na primeira chamada"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(mongo_uri)
+    return _client
+
+def get_database(mongo_uri, db_name='bf_stats_db'):
+    return get_client(mongo_uri)[db_name]
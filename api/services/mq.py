@@ -0,0 +1,140 @@
+import json
+import queue
+import threading
+from contextlib import contextmanager
+
+import pika
+from pika.exceptions import AMQPError
+
+
+class ChannelPool:
+    """
+    Pool de conexoes/canais do RabbitMQ reaproveitados entre requisicoes.
+
+    Cada thread pega um canal exclusivo (pika nao e thread-safe), publica e
+    devolve ao pool. A fila e declarada uma unica vez, quando o canal e aberto.
+    Canais com erro sao descartados e reabertos na proxima requisicao.
+
+    Com transactional=True os canais ficam em modo transacao (tx_select) e
+    sao usados por publish_batch para confirmar lotes inteiros de uma vez.
+    """
+
+    def __init__(self, host, queue_name, size=4, transactional=False, virtual_host='/'):
+        self.host = host
+        self.virtual_host = virtual_host
+        self.queue_name = queue_name
+        self.size = size
+        self.transactional = transactional
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        connection = pika.BlockingConnection(pika.ConnectionParameters(host=self.host, virtual_host=self.virtual_host))
+        channel = connection.channel()
+        channel.queue_declare(queue=self.queue_name, durable=True)
+        if self.transactional:
+            channel.tx_select()
+        return connection, channel
+
+    def _checkout(self):
+        try:
+            connection, channel = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+        try:
+            # Conexoes paradas no pool nao respondem heartbeats sozinhas
+            connection.process_data_events(time_limit=0)
+            if connection.is_open and channel.is_open:
+                return connection, channel
+        except AMQPError:
+            pass
+
+        _close_quietly(connection)
+        return self._open()
+
+    def _release(self, connection, channel):
+        if connection.is_open and channel.is_open:
+            try:
+                self._idle.put_nowait((connection, channel))
+                return
+            except queue.Full:
+                pass
+        _close_quietly(connection)
+
+    @contextmanager
+    def channel(self):
+        """Empresta um canal do pool durante o bloco 'with'"""
+        with self._slots:
+            connection, channel = self._checkout()
+            try:
+                yield channel
+            except AMQPError:
+                _close_quietly(connection)
+                raise
+            except BaseException:
+                self._release(connection, channel)
+                raise
+            self._release(connection, channel)
+
+    def publish_batch(self, payloads, chunk_size=500):
+        """
+        Publica varias mensagens no mesmo canal (pool transacional), confirmando
+        com tx_commit a cada bloco de chunk_size mensagens.
+        Retorna (quantidade confirmada, erro ou None). As mensagens sao
+        confirmadas em ordem, entao as primeiras 'quantidade' foram aceitas pelo broker.
+        """
+        if not self.transactional:
+            raise ValueError("publish_batch exige um ChannelPool com transactional=True")
+
+        bodies = [json.dumps(payload) for payload in payloads]
+        properties = pika.BasicProperties(delivery_mode=2)
+        committed = 0
+        try:
+            with self.channel() as channel:
+                for start in range(0, len(bodies), chunk_size):
+                    for body in bodies[start:start + chunk_size]:
+                        channel.basic_publish(
+                            exchange='',
+                            routing_key=self.queue_name,
+                            body=body,
+                            properties=properties
+                        )
+                    channel.tx_commit()
+                    committed = min(start + chunk_size, len(bodies))
+        except AMQPError as e:
+            return committed, str(e) or e.__class__.__name__
+        return committed, None
+
+    def publish(self, payload):
+        """Publica uma mensagem persistente, tentando de novo uma vez se a conexao caiu"""
+        body = json.dumps(payload)
+        for attempt in range(2):
+            try:
+                with self.channel() as channel:
+                    channel.basic_publish(
+                        exchange='',
+                        routing_key=self.queue_name,
+                        body=body,
+                        properties=pika.BasicProperties(delivery_mode=2)
+                    )
+                return
+            except AMQPError:
+                if attempt == 1:
+                    raise
+
+    def close(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(connection)
+
+
+def _close_quietly(connection):
+    try:
+        if connection.is_open:
+            connection.close()
+    except AMQPError:
+        pass
@@ -0,0 +1,52 @@
+import threading
+import time
+
+from common.tdigest import cumulative_weights, interpolate_cdf
+
+
+class PopulationPercentiles:
+    """
+    Percentis da populacao por plataforma, a partir dos sketches (t-digest)
+    gravados pelo Analyzer em population_sketches. Cada plataforma e lida do
+    banco no maximo uma vez a cada refresh_seconds; o calculo e so uma busca
+    binaria sobre ~100 centroides.
+    """
+
+    def __init__(self, collection, refresh_seconds=60):
+        self.collection = collection
+        self.refresh_seconds = refresh_seconds
+        self._platforms = {}
+        self._lock = threading.Lock()
+
+    def _load(self, platform):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._platforms.get(platform)
+        if cached and now - cached[0] < self.refresh_seconds:
+            return cached[1], cached[2]
+
+        version = 0
+        sketches = {}
+        for doc in self.collection.find({"platform": platform}):
+            weights = doc.get('weights', [])
+            sketches[doc['metric']] = (doc.get('means', []), cumulative_weights(weights), sum(weights),
+                                       doc.get('min'), doc.get('max'))
+            version += doc.get('version', 0)
+
+        with self._lock:
+            self._platforms[platform] = (now, version, sketches)
+        return version, sketches
+
+    def version(self, platform):
+        """Muda sempre que algum sketch da plataforma e regravado (entra no ETag)"""
+        return self._load(platform)[0]
+
+    def ranks(self, platform, values):
+        """Retorna (versao dos sketches, {metrica: percentil 0-100 ou None})"""
+        version, sketches = self._load(platform)
+        ranks = {}
+        for metric, value in values.items():
+            sketch = sketches.get(metric)
+            fraction = interpolate_cdf(*sketch, value) if sketch and value is not None else None
+            ranks[metric] = round(fraction * 100, 1) if fraction is not None else None
+        return version, ranks
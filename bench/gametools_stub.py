@@ -0,0 +1,132 @@
+# Servidor falso da GameTools API para benchmarks e testes locais.
+# Responde na mesma rota usada pelo Scraper (/bf6/stats/) com estatisticas
+# deterministicas por jogador, com latencia e taxa de erro configuraveis.
+#
+# Uso isolado: python bench/gametools_stub.py --port 8099 --latency-ms 80 --error-rate 0.02
+# e depois GAMETOOLS_URL=http://localhost:8099 nos workers.
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CLASSES = ('Assault', 'Engineer', 'Support', 'Recon')
+
+
+def fake_player_stats(player_name, platform):
+    """Estatisticas estaveis para o mesmo jogador (mesmo hash -> mesmos numeros)"""
+    seed = int(hashlib.sha1(f"{platform}:{player_name}".encode()).hexdigest()[:12], 16)
+    rng = random.Random(seed)
+    deaths = rng.randint(50, 20000)
+    kills = int(deaths * rng.uniform(0.3, 3.5))
+    return {
+        "userName": player_name,
+        "kills": kills,
+        "deaths": deaths,
+        "wins": rng.randint(0, 2000),
+        "loses": rng.randint(0, 2000),
+        "accuracy": f"{rng.uniform(8, 35):.2f}%",
+        "secondsPlayed": rng.randint(600, 400 * 3600),
+        "headshots": int(kills * rng.uniform(0.05, 0.4)),
+        "classes": [{"class_name": rng.choice(CLASSES)}],
+    }
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50, jitter_ms=0, error_rate=0.0, not_found_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.not_found = 0
+        self._lock = threading.Lock()
+
+    def decide(self):
+        """Sorteia (atraso em segundos, status HTTP) para uma requisicao"""
+        with self._lock:
+            self.requests += 1
+            delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            roll = self.random.random()
+            if roll < self.error_rate:
+                self.errors += 1
+                status = 503
+            elif roll < self.error_rate + self.not_found_rate:
+                self.not_found += 1
+                status = 404
+            else:
+                status = 200
+        return max(delay, 0) / 1000, status
+
+    def stats(self):
+        return {"requests": self.requests, "errors": self.errors, "not_found": self.not_found}
+
+
+def make_handler(config):
+    class GameToolsHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip('/') != '/bf6/stats':
+                self._send(404, {"errors": ["rota desconhecida"]})
+                return
+
+            query = parse_qs(url.query)
+            player_name = query.get('name', [''])[0]
+            platform = query.get('platform', ['pc'])[0]
+
+            delay, status = config.decide()
+            time.sleep(delay)
+            if status == 200:
+                self._send(200, fake_player_stats(player_name, platform))
+            elif status == 404:
+                self._send(404, {"errors": ["player not found"]})
+            else:
+                self._send(status, {"errors": ["upstream indisponivel"]})
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return GameToolsHandler
+
+
+def start_stub(port, config):
+    """Sobe o servidor em uma thread e devolve o ThreadingHTTPServer (use .shutdown())"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="GameTools API falsa para testes locais")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fracao de respostas 503")
+    parser.add_argument('--not-found-rate', type=float, default=0.0, help="fracao de respostas 404")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.not_found_rate)
+    server = start_stub(args.port, config)
+    print(f"GameTools falsa em http://localhost:{args.port} (CTRL+C para sair)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(config.stats()))
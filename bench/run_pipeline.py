@@ -0,0 +1,385 @@
+# Benchmark ponta a ponta do pipeline: API -> worker_scraper -> worker_analyzer.
+#
+# Usa RabbitMQ e MongoDB locais (docker-compose up -d) e uma GameTools falsa
+# (bench/gametools_stub.py), sobe os servicos como subprocessos, envia N jogadores
+# sinteticos e mede taxa de enqueue, vazao por etapa, latencia p50/p99 e memoria.
+#
+# Cada rodada usa um vhost proprio no RabbitMQ (bf_bench_<run_id>), criado e apagado
+# pela API de gerenciamento (porta 15672): as filas reais do broker nao sao tocadas.
+# O banco MONGO_DB do benchmark (padrao bf_stats_bench) e apagado no inicio de cada rodada.
+#
+# Exemplo:
+#   python bench/run_pipeline.py --players 5000 --latency-ms 80 --error-rate 0.01 \
+#       --scraper-mode async --analyzer-batch-size 200 --output bench_results.jsonl
+import argparse
+import json
+import os
+import platform as host_platform
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from base64 import b64encode
+
+from pymongo import MongoClient
+
+from gametools_stub import StubConfig, start_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLATFORMS = ('pc', 'ps5', 'xboxseries')
+# Resultados finais de uma mensagem no Scraper ('retry' volta para a fila)
+SCRAPE_FINAL_RESULTS = ('coletado', 'cache', 'nao_encontrado', 'descartado')
+# Portas padrao dos servicos durante o benchmark (nao colidem com as de desenvolvimento)
+API_PORT = 5055
+STUB_PORT = 8099
+SCRAPER_METRICS_PORT = 9111
+ANALYZER_METRICS_PORT = 9121
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark local do pipeline Battlefield Stats")
+    parser.add_argument('--players', type=int, default=1000, help="jogadores sinteticos enviados")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="jogadores por POST /analyze-players (1 = usa POST /analyze-player)")
+    parser.add_argument('--latency-ms', type=float, default=50, help="latencia da GameTools falsa")
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fracao de respostas 503")
+    parser.add_argument('--not-found-rate', type=float, default=0.0, help="fracao de respostas 404")
+    parser.add_argument('--scraper-mode', choices=('sync', 'async'), default='sync')
+    parser.add_argument('--scraper-workers', type=int, default=1)
+    parser.add_argument('--scraper-concurrency', type=int, default=16)
+    parser.add_argument('--rate-limit', type=float, default=1000, help="SCRAPER_RATE_LIMIT (req/s)")
+    parser.add_argument('--analyzer-workers', type=int, default=1)
+    parser.add_argument('--analyzer-batch-size', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600, help="segundos esperando o pipeline esvaziar")
+    parser.add_argument('--rabbitmq-host', default=os.environ.get('RABBITMQ_HOST', 'localhost'))
+    parser.add_argument('--rabbitmq-management-url', help="API de gerenciamento (padrao: http://<host>:15672)")
+    parser.add_argument('--rabbitmq-user', default='guest', help="usuario da API de gerenciamento e dos servicos")
+    parser.add_argument('--rabbitmq-password', default='guest')
+    parser.add_argument('--mongo-uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--mongo-db', default='bf_stats_bench')
+    parser.add_argument('--output', help="arquivo JSONL onde o resultado da rodada e acrescentado")
+    parser.add_argument('--log-dir', help="guarda a saida de cada servico nesta pasta")
+    return parser.parse_args()
+
+
+# --- Ambiente ---
+
+def reset_database(args):
+    """Apaga o banco do benchmark"""
+    if args.mongo_db == 'bf_stats_db':
+        sys.exit("Erro: use um banco proprio para o benchmark (--mongo-db), nao o bf_stats_db.")
+
+    client = MongoClient(args.mongo_uri)
+    client.drop_database(args.mongo_db)
+    return client[args.mongo_db]
+
+def management_request(args, method, path, payload=None):
+    base = args.rabbitmq_management_url or f"http://{args.rabbitmq_host}:15672"
+    credentials = b64encode(f"{args.rabbitmq_user}:{args.rabbitmq_password}".encode()).decode()
+    request = urllib.request.Request(
+        f"{base.rstrip('/')}/api/{path}",
+        data=json.dumps(payload).encode() if payload is not None else None,
+        headers={'Content-Type': 'application/json', 'Authorization': f"Basic {credentials}"},
+        method=method
+    )
+    urllib.request.urlopen(request, timeout=10).read()
+
+def create_vhost(args, vhost):
+    """Cria o vhost da rodada e da permissao total ao usuario dos servicos"""
+    quoted = urllib.parse.quote(vhost, safe='')
+    management_request(args, 'PUT', f"vhosts/{quoted}")
+    management_request(args, 'PUT', f"permissions/{quoted}/{urllib.parse.quote(args.rabbitmq_user, safe='')}",
+                       {"configure": ".*", "write": ".*", "read": ".*"})
+
+def delete_vhost(args, vhost):
+    """Apaga o vhost da rodada (e todas as filas dele)"""
+    try:
+        management_request(args, 'DELETE', f"vhosts/{urllib.parse.quote(vhost, safe='')}")
+    except urllib.error.URLError as e:
+        print(f"Aviso: nao foi possivel apagar o vhost {vhost}: {e}", file=sys.stderr)
+
+def start_service(name, script, env, args, extra_args=()):
+    log = subprocess.DEVNULL
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+        log = open(os.path.join(args.log_dir, f"{name}.log"), 'w')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, script), *extra_args],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return name, process
+
+def start_services(args, vhost):
+    base_env = dict(
+        os.environ,
+        RABBITMQ_HOST=args.rabbitmq_host,
+        RABBITMQ_VHOST=vhost,
+        MONGO_URI=args.mongo_uri,
+        MONGO_DB=args.mongo_db,
+        GAMETOOLS_URL=f"http://127.0.0.1:{STUB_PORT}",
+        PYTHONUNBUFFERED='1',
+    )
+    services = [start_service('api', 'api/app.py', dict(base_env, API_PORT=str(API_PORT), FLASK_ENV='production'), args)]
+    for index in range(args.scraper_workers):
+        env = dict(
+            base_env,
+            METRICS_PORT=str(SCRAPER_METRICS_PORT + index),
+            SCRAPER_MODE=args.scraper_mode,
+            SCRAPER_CONCURRENCY=str(args.scraper_concurrency),
+            SCRAPER_RATE_LIMIT=str(args.rate_limit),
+            SCRAPER_RATE_BURST=str(max(int(args.rate_limit), 1)),
+            # Jogadores sao unicos por rodada; o cache so atrapalharia a medicao
+            CACHE_TTL_SECONDS='0',
+        )
+        services.append(start_service(f'scraper_{index}', 'worker_scraper/main.py', env, args))
+    for index in range(args.analyzer_workers):
+        env = dict(
+            base_env,
+            METRICS_PORT=str(ANALYZER_METRICS_PORT + index),
+            ANALYZER_BATCH_SIZE=str(args.analyzer_batch_size),
+        )
+        services.append(start_service(f'analyzer_{index}', 'worker_analyzer/main.py', env, args))
+    return services
+
+def stop_services(services):
+    for _, process in services:
+        process.terminate()
+    for _, process in services:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def wait_until_ready(urls, services, timeout=60):
+    deadline = time.monotonic() + timeout
+    pending = list(urls)
+    while pending:
+        for name, process in services:
+            if process.poll() is not None:
+                sys.exit(f"Erro: servico {name} terminou na inicializacao (codigo {process.returncode}).")
+        try:
+            urllib.request.urlopen(pending[0], timeout=2).read()
+            pending.pop(0)
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() > deadline:
+                sys.exit(f"Erro: {pending[0]} nao respondeu em {timeout}s.")
+            time.sleep(0.2)
+
+
+# --- Medicoes ---
+
+def read_metrics(url):
+    """Le um /metrics e devolve {(nome, labels_ordenados): valor}"""
+    samples = {}
+    text = urllib.request.urlopen(url, timeout=5).read().decode()
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        name, _, labels = series.partition('{')
+        pairs = tuple(sorted(
+            tuple(pair.split('=', 1)) for pair in labels.rstrip('}').split(',') if pair
+        ))
+        samples[(name, tuple((key, raw.strip('"')) for key, raw in pairs))] = float(value)
+    return samples
+
+def metric_sum(samples_list, name, **labels):
+    """Soma uma metrica (em varios processos) filtrando pelos labels informados"""
+    total = 0.0
+    for samples in samples_list:
+        for (sample_name, sample_labels), value in samples.items():
+            if sample_name == name and all((key, value_) in sample_labels for key, value_ in labels.items()):
+                total += value
+    return total
+
+def memory_kb(pid):
+    """RSS atual e pico (VmHWM) do processo, em KB (somente Linux)"""
+    result = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    result['rss' if key == 'VmRSS' else 'peak'] = int(value.split()[0])
+    except OSError:
+        pass
+    return result or None
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def percentile(p):
+        # Nearest-rank
+        return round(values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))], 4)
+
+    return {
+        "count": len(values),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": round(values[-1], 4),
+        "mean": round(sum(values) / len(values), 4),
+    }
+
+def stage_rate(timestamps):
+    """Itens por segundo entre o primeiro e o ultimo item concluido na etapa"""
+    if len(timestamps) < 2:
+        return None, 0.0
+    window = max(timestamps) - min(timestamps)
+    return (round((len(timestamps) - 1) / window, 2) if window > 0 else None), round(window, 3)
+
+
+# --- Carga ---
+
+def post_json(url, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+def enqueue_players(players, batch_size):
+    """Envia os jogadores para a API e devolve quantos foram aceitos"""
+    base = f"http://127.0.0.1:{API_PORT}"
+    accepted = 0
+    if batch_size <= 1:
+        for player in players:
+            status, _ = post_json(f"{base}/analyze-player", player)
+            accepted += status == 202
+        return accepted
+
+    for start in range(0, len(players), batch_size):
+        status, body = post_json(f"{base}/analyze-players", {"players": players[start:start + batch_size]})
+        if status == 202:
+            accepted += body.get('aceitos', 0)
+    return accepted
+
+def wait_for_drain(accepted, scraper_urls, analyzer_urls, timeout):
+    """Espera ate todas as mensagens aceitas passarem pelas duas etapas"""
+    deadline = time.monotonic() + timeout
+    while True:
+        scraper = [read_metrics(url) for url in scraper_urls]
+        analyzer = [read_metrics(url) for url in analyzer_urls]
+        scraped = sum(metric_sum(scraper, 'bf_messages_total', stage='scrape', result=result)
+                      for result in SCRAPE_FINAL_RESULTS)
+        collected = metric_sum(scraper, 'bf_messages_total', stage='scrape', result='coletado')
+        analyzed = (metric_sum(analyzer, 'bf_messages_total', stage='analyze')
+                    + metric_sum(analyzer, 'bf_errors_total', stage='analyze'))
+        if scraped >= accepted and analyzed >= collected:
+            return True, scraper, analyzer
+        if time.monotonic() > deadline:
+            return False, scraper, analyzer
+        time.sleep(0.5)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    run_id = uuid.uuid4().hex[:8]
+    vhost = f"bf_bench_{run_id}"
+    db = reset_database(args)
+    create_vhost(args, vhost)
+    stub_config = StubConfig(args.latency_ms, args.jitter_ms, args.error_rate, args.not_found_rate, seed=42)
+    stub = start_stub(STUB_PORT, stub_config)
+
+    services = []
+    scraper_urls = [f"http://127.0.0.1:{SCRAPER_METRICS_PORT + i}/metrics" for i in range(args.scraper_workers)]
+    analyzer_urls = [f"http://127.0.0.1:{ANALYZER_METRICS_PORT + i}/metrics" for i in range(args.analyzer_workers)]
+    try:
+        services = start_services(args, vhost)
+        wait_until_ready([f"http://127.0.0.1:{API_PORT}/", *scraper_urls, *analyzer_urls], services)
+
+        players = [
+            {"player_name": f"bench_{run_id}_{i}", "platform": PLATFORMS[i % len(PLATFORMS)]}
+            for i in range(args.players)
+        ]
+
+        print(f"Enviando {args.players} jogadores...", file=sys.stderr)
+        started = time.time()
+        accepted = enqueue_players(players, args.batch_size)
+        enqueue_seconds = time.time() - started
+
+        print(f"{accepted} aceitos; aguardando o pipeline esvaziar...", file=sys.stderr)
+        completed, scraper, analyzer = wait_for_drain(accepted, scraper_urls, analyzer_urls, args.timeout)
+        wall_seconds = time.time() - started
+        memory = {name: memory_kb(process.pid) for name, process in services}
+    finally:
+        stop_services(services)
+        stub.shutdown()
+        delete_vhost(args, vhost)
+
+    documents = list(db['raw_player_stats'].find(
+        {"enqueued_at": {"$gte": started - 1}},
+        {"enqueued_at": 1, "created_at": 1, "analysis.processed_at": 1}
+    ))
+    analyzed = [doc for doc in documents if doc.get('analysis')]
+    scrape_rate, scrape_window = stage_rate([doc['created_at'] for doc in documents])
+    analyze_rate, analyze_window = stage_rate([doc['analysis']['processed_at'] for doc in analyzed])
+
+    return {
+        "run_id": run_id,
+        "timestamp": round(started, 3),
+        "git_commit": git_commit(),
+        "host": {"python": host_platform.python_version(), "machine": host_platform.machine(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ('output', 'log_dir', 'rabbitmq_password')},
+        "completed": completed,
+        "wall_seconds": round(wall_seconds, 3),
+        "enqueue": {
+            "sent": args.players,
+            "accepted": accepted,
+            "seconds": round(enqueue_seconds, 3),
+            "rate_per_s": round(accepted / enqueue_seconds, 2) if enqueue_seconds > 0 else None,
+        },
+        "stages": {
+            "scrape": {
+                "collected": int(metric_sum(scraper, 'bf_messages_total', stage='scrape', result='coletado')),
+                "not_found": int(metric_sum(scraper, 'bf_messages_total', stage='scrape', result='nao_encontrado')),
+                "retried": int(metric_sum(scraper, 'bf_messages_total', stage='scrape', result='retry')),
+                "dead_lettered": int(metric_sum(scraper, 'bf_messages_total', stage='scrape', result='descartado')),
+                "errors": int(metric_sum(scraper, 'bf_errors_total', stage='scrape')),
+                "fetch_errors": int(metric_sum(scraper, 'bf_errors_total', stage='fetch')),
+                "rate_per_s": scrape_rate,
+                "window_s": scrape_window,
+            },
+            "analyze": {
+                "analyzed": int(metric_sum(analyzer, 'bf_messages_total', stage='analyze', result='analisado')),
+                "ignored": int(metric_sum(analyzer, 'bf_messages_total', stage='analyze', result='ignorado')),
+                "errors": int(metric_sum(analyzer, 'bf_errors_total', stage='analyze')),
+                "rate_per_s": analyze_rate,
+                "window_s": analyze_window,
+            },
+        },
+        "latency_s": {
+            "enqueue_to_scraped": summarize([doc['created_at'] - doc['enqueued_at'] for doc in documents]),
+            "scraped_to_analyzed": summarize([doc['analysis']['processed_at'] - doc['created_at'] for doc in analyzed]),
+            "end_to_end": summarize([doc['analysis']['processed_at'] - doc['enqueued_at'] for doc in analyzed]),
+        },
+        "memory_kb": memory,
+        "stub": stub_config.stats(),
+    }
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'a') as output:
+            output.write(json.dumps(result) + '\n')
+    sys.exit(0 if result['completed'] else 1)
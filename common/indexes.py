@@ -0,0 +1,38 @@
+# Indices de todas as colecoes, em um lugar so. Cada servico chama ensure_indexes()
+# na partida; create_index e idempotente (nao faz nada se o indice ja existir),
+# entao nao importa qual servico cria primeiro.
+from pymongo import ASCENDING, DESCENDING
+
+from common.tracking import TRACKED_COLLECTION
+
+INDEXES = {
+    'raw_player_stats': [
+        # GET /player sem ponteiro em player_latest (ultimo snapshot por jogador)
+        [("player_name", ASCENDING), ("_id", DESCENDING)],
+        # GET /export?scope=snapshots (filtro since e ordenacao)
+        [("analysis.processed_at", ASCENDING)],
+    ],
+    # Analyzer (tendencias) e GET /player/<nome>/history: buckets que cruzam o intervalo pedido
+    'player_history': [
+        [("player_key", ASCENDING), ("start", ASCENDING)],
+    ],
+    # GET /ranking ordena por KD e desempata pelo _id (base da paginacao por cursor)
+    'leaderboard': [
+        # GET /export (filtro since e ordenacao)
+        [("analysis.processed_at", ASCENDING)],
+        [("analysis.kd_ratio", DESCENDING), ("_id", ASCENDING)],
+        [("platform", ASCENDING), ("analysis.kd_ratio", DESCENDING), ("_id", ASCENDING)],
+        [("analysis.classification", ASCENDING), ("analysis.kd_ratio", DESCENDING), ("_id", ASCENDING)],
+        [("platform", ASCENDING), ("analysis.classification", ASCENDING),
+         ("analysis.kd_ratio", DESCENDING), ("_id", ASCENDING)],
+    ],
+    # O Scheduler sincroniza so o que mudou desde a ultima leitura (updated_at)
+    TRACKED_COLLECTION: [
+        [("updated_at", ASCENDING)],
+    ],
+}
+
+def ensure_indexes(db):
+    for collection_name, indexes in INDEXES.items():
+        for keys in indexes:
+            db[collection_name].create_index(keys)
@@ -0,0 +1,6 @@
+def player_key(player_name, platform):
+    """
+    Chave de um jogador em uma plataforma (plataforma:nome, minusculo). Mesmo
+    formato em leaderboard, player_history, tracked_players e no cache do Scraper.
+    """
+    return f"{str(platform).strip().lower()}:{str(player_name).strip().lower()}"
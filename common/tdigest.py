@@ -0,0 +1,126 @@
+# t-digest compartilhado: o Analyzer monta os sketches de percentis e a API
+# le os centroides gravados em population_sketches para calcular o percentil.
+import math
+from bisect import bisect_right
+
+
+class TDigest:
+    """
+    Sketch de quantis t-digest (variante 'merging', escala k1).
+
+    Resume uma distribuicao em poucos centroides (media, peso), com mais
+    resolucao nas caudas. Memoria limitada pela compressao (~compression
+    centroides) e dois sketches podem ser somados com merge().
+    """
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer = []
+
+    def add(self, value, weight=1):
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= self.compression * 5:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self._buffer.extend(zip(other.means, other.weights))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def _k_inverse(self, k):
+        return (math.sin(k * 2 * math.pi / self.compression) + 1) / 2
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        items = sorted(list(zip(self.means, self.weights)) + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in items)
+
+        means, weights = [], []
+        mean, weight = items[0]
+        q_start = 0.0
+        q_limit = self._k_inverse(self._k(q_start) + 1)
+        for next_mean, next_weight in items[1:]:
+            if q_start + (weight + next_weight) / total <= q_limit:
+                # Cabe no centroide atual: media ponderada
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                q_start += weight / total
+                q_limit = self._k_inverse(self._k(q_start) + 1)
+                mean, weight = next_mean, next_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def cdf(self, value):
+        """Fracao (0 a 1) dos valores <= value, interpolada entre os centroides"""
+        self._compress()
+        return interpolate_cdf(self.means, cumulative_weights(self.weights), sum(self.weights),
+                               self.min, self.max, value)
+
+    def to_dict(self):
+        self._compress()
+        return {
+            "compression": self.compression,
+            "means": self.means,
+            "weights": self.weights,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(data.get('compression', 100))
+        digest.means = list(data.get('means', []))
+        digest.weights = list(data.get('weights', []))
+        digest.count = data.get('count', 0)
+        digest.min = data.get('min', math.inf)
+        digest.max = data.get('max', -math.inf)
+        return digest
+
+
+def cumulative_weights(weights):
+    """Peso acumulado ate o centro de cada centroide (metade do proprio peso)"""
+    cumulative, total = [], 0
+    for weight in weights:
+        cumulative.append(total + weight / 2)
+        total += weight
+    return cumulative
+
+def interpolate_cdf(means, cumulative, total, minimum, maximum, value):
+    """Interpolacao linear entre (min, 0), os centros dos centroides e (max, total)"""
+    if not means:
+        return None
+    if value < minimum:
+        return 0.0
+    if value >= maximum:
+        return 1.0
+
+    xs = [minimum] + means + [maximum]
+    ys = [0.0] + cumulative + [total]
+    index = bisect_right(xs, value)
+    x0, x1 = xs[index - 1], xs[index]
+    y0, y1 = ys[index - 1], ys[index]
+    if x1 == x0:
+        return y1 / total
+    return (y0 + (y1 - y0) * (value - x0) / (x1 - x0)) / total
@@ -0,0 +1,46 @@
+# Jogadores acompanhados pelo Scheduler (worker_scheduler).
+# A API registra cada pedido de analise (popularidade) e o Scraper registra o
+# resultado de cada busca (frescor); o Scheduler le as duas coisas para decidir
+# quando buscar cada jogador de novo.
+from pymongo import UpdateOne
+
+from common.players import player_key
+
+TRACKED_COLLECTION = 'tracked_players'
+
+def track_requests(collection, players, now):
+    """
+    Registra pedidos vindos da API: cada pedido soma 1 na popularidade do jogador.
+    Como a API ja enfileirou a busca, o jogador fica marcado como agendado e o
+    Scheduler nao manda uma segunda busca para o mesmo pedido.
+    """
+    operations = [
+        UpdateOne(
+            {"_id": player_key(player_name, platform)},
+            {
+                "$setOnInsert": {"player_name": player_name, "platform": platform, "created_at": now},
+                "$inc": {"popularity": 1},
+                "$set": {"last_requested_at": now, "scheduled_at": now, "updated_at": now}
+            },
+            upsert=True
+        )
+        for player_name, platform in players
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+def record_fetch(collection, player_name, platform, now, error=None, fetched_at=None):
+    """
+    Registra o resultado final de uma busca (sucesso, jogador inexistente ou falha definitiva).
+
+    fetched_at: quando os dados foram realmente buscados, se for antes de 'now'
+    (resposta vinda do cache); o jogador fica fresco e deixa de estar agendado.
+    """
+    if error is None:
+        update = {"$set": {"last_fetched_at": fetched_at or now, "last_attempt_at": now, "failures": 0,
+                           "last_error": None, "updated_at": now}}
+    else:
+        update = {"$set": {"last_attempt_at": now, "last_error": error, "updated_at": now},
+                  "$inc": {"failures": 1}}
+    # Sem upsert: jogadores que nunca passaram pela API nao sao acompanhados
+    collection.update_one({"_id": player_key(player_name, platform)}, update)
@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+from bisect import bisect_right
+
+import pytest
+
+# Mesmo esquema dos servicos: importa o pacote 'common' a partir da raiz do projeto
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.tdigest import TDigest, cumulative_weights, interpolate_cdf
+
+# Erro maximo aceito no percentil, em pontos (0-100). Medido: ~0.25 com compression=100.
+TOLERANCE_POINTS = 0.5
+PARTS = 8
+VALUES_PER_PART = 5000
+
+DISTRIBUTIONS = {
+    "lognormal": lambda rng: rng.lognormvariate(0, 1),
+    "normal": lambda rng: rng.gauss(0, 1),
+    "uniform": lambda rng: rng.uniform(0, 100),
+}
+
+
+def build_merged(generate, seed):
+    """Varios sketches parciais (como varios Analyzers) somados com merge()"""
+    rng = random.Random(seed)
+    values = []
+    parts = []
+    for _ in range(PARTS):
+        digest = TDigest(compression=100)
+        for _ in range(VALUES_PER_PART):
+            value = generate(rng)
+            digest.add(value)
+            values.append(value)
+        parts.append(digest)
+
+    merged = TDigest(compression=100)
+    for digest in parts:
+        merged.merge(digest)
+    values.sort()
+    return merged, values
+
+
+@pytest.mark.parametrize("name", sorted(DISTRIBUTIONS))
+def test_merged_cdf_matches_exact_ranks(name):
+    merged, values = build_merged(DISTRIBUTIONS[name], seed=7)
+
+    assert merged.count == PARTS * VALUES_PER_PART
+    worst = 0.0
+    for permille in range(1, 1000):
+        value = values[permille * len(values) // 1000]
+        exact = bisect_right(values, value) / len(values)
+        worst = max(worst, abs(merged.cdf(value) - exact) * 100)
+    assert worst <= TOLERANCE_POINTS, f"{name}: erro de {worst:.3f} pontos"
+
+
+def test_cdf_outside_range():
+    merged, values = build_merged(DISTRIBUTIONS["uniform"], seed=3)
+    assert merged.cdf(values[0] - 1) == 0.0
+    assert merged.cdf(values[-1]) == 1.0
+
+
+def test_serialized_sketch_gives_same_cdf():
+    """A API calcula o percentil a partir dos centroides gravados (to_dict)"""
+    merged, values = build_merged(DISTRIBUTIONS["lognormal"], seed=11)
+    data = TDigest.from_dict(merged.to_dict()).to_dict()
+
+    for value in values[::997]:
+        from_db = interpolate_cdf(data['means'], cumulative_weights(data['weights']), sum(data['weights']),
+                                  data['min'], data['max'], value)
+        assert from_db == pytest.approx(merged.cdf(value))
@@ -0,0 +1,74 @@
+from pymongo import UpdateOne
+
+from common.players import player_key
+
+# Serie temporal compacta por jogador/plataforma (bucket pattern): cada documento
+# guarda ate BUCKET_SIZE amostras em arrays paralelos, em vez de um snapshot
+# completo por coleta como em raw_player_stats.
+HISTORY_COLLECTION = 'player_history'
+BUCKET_SIZE = 200
+TREND_WINDOWS = {"7d": 7 * 86400, "30d": 30 * 86400}
+
+def history_sample(player_data):
+    stats = player_data.get('stats', {})
+    return (
+        player_data.get('created_at', 0),
+        stats.get('kills', 0),
+        stats.get('deaths', 0),
+        stats.get('time_played_hours', 0),
+        stats.get('accuracy_percent', 0)
+    )
+
+def history_append(player_data):
+    """Acrescenta o snapshot ao bucket aberto do jogador (cria um novo quando o atual enche)"""
+    t, kills, deaths, hours, accuracy = history_sample(player_data)
+    return UpdateOne(
+        {
+            "player_key": player_key(player_data.get('player_name'), player_data.get('platform')),
+            "count": {"$lt": BUCKET_SIZE}
+        },
+        {
+            "$push": {"t": t, "kills": kills, "deaths": deaths, "hours": hours, "accuracy": accuracy},
+            "$inc": {"count": 1},
+            "$min": {"start": t},
+            "$max": {"end": t},
+            "$setOnInsert": {
+                "player_name": player_data.get('player_name'),
+                "platform": player_data.get('platform')
+            }
+        },
+        upsert=True
+    )
+
+def load_recent_history(db, player_keys, since):
+    """Amostras de varios jogadores desde 'since', com uma unica consulta. Retorna {player_key: [amostras]}"""
+    history = {}
+    buckets = db[HISTORY_COLLECTION].find(
+        {"player_key": {"$in": list(player_keys)}, "end": {"$gte": since}},
+        {"player_key": 1, "t": 1, "kills": 1, "deaths": 1, "hours": 1, "accuracy": 1}
+    )
+    for bucket in buckets:
+        samples = zip(bucket['t'], bucket['kills'], bucket['deaths'], bucket['hours'], bucket['accuracy'])
+        history.setdefault(bucket['player_key'], []).extend(sample for sample in samples if sample[0] >= since)
+    for samples in history.values():
+        samples.sort()
+    return history
+
+def compute_trends(samples, player_data):
+    """
+    Variacao nas janelas de TREND_WINDOWS comparando o snapshot atual com a amostra
+    mais antiga dentro da janela: KD do periodo (kills/deaths feitos no periodo)
+    e horas jogadas no periodo. None quando nao ha amostra anterior na janela.
+    """
+    t, kills, deaths, hours, _ = history_sample(player_data)
+    trends = {}
+    for name, window in TREND_WINDOWS.items():
+        base = next((sample for sample in samples if t - window <= sample[0] < t), None)
+        if base is None:
+            trends[f"kd_{name}"] = None
+            trends[f"hours_{name}"] = None
+            continue
+        period_deaths = max(deaths - base[2], 1) # Evitar divisao por zero
+        trends[f"kd_{name}"] = round((kills - base[1]) / period_deaths, 2)
+        trends[f"hours_{name}"] = round(hours - base[3], 2)
+    return trends
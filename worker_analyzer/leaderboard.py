@@ -0,0 +1,71 @@
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from common.players import player_key
+
+# Uma entrada por (jogador, plataforma) com a analise mais recente.
+# O GET /ranking le daqui em vez de varrer o historico de raw_player_stats.
+LEADERBOARD_COLLECTION = 'leaderboard'
+DUPLICATE_KEY = 11000
+
+def leaderboard_update(player_data, analysis):
+    """
+    Monta o upsert da entrada do jogador. O filtro por created_at impede que um
+    snapshot antigo (processado fora de ordem) sobrescreva um mais novo: nesse caso
+    o upsert tenta inserir um _id repetido e o erro de chave duplicada e ignorado.
+    """
+    created_at = player_data.get('created_at', 0)
+    return UpdateOne(
+        {
+            "_id": player_key(player_data.get('player_name'), player_data.get('platform')),
+            "created_at": {"$lte": created_at}
+        },
+        {"$set": {
+            "player_name": player_data.get('player_name'),
+            "platform": player_data.get('platform'),
+            "api_source": player_data.get('api_source'),
+            "stats": player_data.get('stats', {}),
+            "analysis": analysis,
+            "snapshot_id": player_data['_id'],
+            "created_at": created_at
+        }},
+        upsert=True
+    )
+
+def write_leaderboard(db, operations):
+    """Aplica os upserts em um unico bulk_write nao ordenado"""
+    if not operations:
+        return
+    try:
+        db[LEADERBOARD_COLLECTION].bulk_write(operations, ordered=False)
+    except (BulkWriteError, DuplicateKeyError) as e:
+        errors = e.details.get('writeErrors', []) if isinstance(e, BulkWriteError) else [{"code": e.code}]
+        # Chave duplicada = ja existe um snapshot mais novo no ranking
+        if any(error.get('code') != DUPLICATE_KEY for error in errors):
+            raise
+
+def rebuild_leaderboard(db):
+    """Recria o ranking a partir do historico ja analisado (uso unico, para dados antigos)"""
+    pipeline = [
+        {"$match": {"analysis": {"$exists": True}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {
+            "_id": {"$concat": [
+                {"$toLower": {"$trim": {"input": "$platform"}}},
+                ":",
+                {"$toLower": {"$trim": {"input": "$player_name"}}}
+            ]},
+            "doc": {"$first": "$$ROOT"}
+        }},
+        {"$project": {
+            "player_name": "$doc.player_name",
+            "platform": "$doc.platform",
+            "api_source": "$doc.api_source",
+            "stats": "$doc.stats",
+            "analysis": "$doc.analysis",
+            "snapshot_id": "$doc._id",
+            "created_at": "$doc.created_at"
+        }},
+        {"$merge": {"into": LEADERBOARD_COLLECTION, "whenMatched": "replace"}}
+    ]
+    db['raw_player_stats'].aggregate(pipeline, allowDiskUse=True)
@@ -1,17 +1,52 @@
 import pika
 import json
+import os
+import sys
 import time
-from pymongo import MongoClient
+import numpy as np
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout
 from bson.objectid import ObjectId
 
+# Permite importar o pacote compartilhado 'common' (raiz do projeto)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.indexes import ensure_indexes
+from common.metrics import DB_WRITE_SECONDS, ERRORS, MESSAGES, PIPELINE_SECONDS, start_http_server
+from common.players import player_key
+from history import HISTORY_COLLECTION, TREND_WINDOWS, compute_trends, history_append, load_recent_history
+from leaderboard import leaderboard_update, rebuild_leaderboard, write_leaderboard
+from sketches import PopulationSketches, rebuild_sketches
+
 # Configuracoes
-RABBITMQ_HOST = 'localhost'
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
+RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
 QUEUE_NAME = 'analysis_queue' # O Analyzer escuta esta fila
-MONGO_URI = 'mongodb://localhost:27017/'
+# Mensagens que falharam por erro nao passageiro ficam aqui para inspecao manual
+DEAD_LETTER_QUEUE = 'analysis_dead_letter'
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB = os.environ.get('MONGO_DB', 'bf_stats_db')
+
+# Modo em lote: junta ate N mensagens (ou espera ate T ms) e processa tudo de uma vez.
+# Com ANALYZER_BATCH_SIZE=1 o Analyzer usa o callback de uma mensagem por vez.
+ANALYZER_BATCH_SIZE = int(os.environ.get('ANALYZER_BATCH_SIZE', 1))
+ANALYZER_BATCH_WAIT_MS = int(os.environ.get('ANALYZER_BATCH_WAIT_MS', 200))
+# Intervalo para recriar os sketches de percentis (population_sketches) a partir do ranking
+SKETCH_REBUILD_SECONDS = float(os.environ.get('SKETCH_REBUILD_SECONDS', 300))
+# Porta do endpoint /metrics deste worker (0 desliga)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9102))
+
+# Falhas passageiras do MongoDB: vale devolver a mensagem para a fila e tentar de novo
+TRANSIENT_ERRORS = (AutoReconnect, NetworkTimeout, ConnectionFailure)
+
+_client = None
 
 def get_db_connection():
-    client = MongoClient(MONGO_URI)
-    return client['bf_stats_db']
+    # Reaproveita o mesmo MongoClient entre mensagens
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URI)
+    return _client[MONGO_DB]
 
 def calculate_classification(kd_ratio, hours_played):
     """
@@ -27,64 +62,239 @@ def calculate_classification(kd_ratio, hours_played):
     else:
         return "Veterano"
 
-def callback(ch, method, properties, body):
-    print("Analyzer: Recebi uma tarefa!")
+def analyze_batch(documents):
+    """
+    Versao vetorizada (NumPy) das etapas 2 a 4 do callback().
+    Retorna uma lista de (kd_ratio, classificacao), na mesma ordem dos documentos.
+    """
+    stats = [doc.get('stats', {}) for doc in documents]
+    kills = np.array([s.get('kills', 0) for s in stats], dtype=np.float64)
+    deaths = np.array([s.get('deaths', 1) for s in stats], dtype=np.float64)
+    deaths[deaths == 0] = 1 # Evitar divisao por zero
+    hours = np.array([s.get('time_played_hours', 0) for s in stats], dtype=np.float64)
+
+    # round() do Python em cada elemento: np.round pode diferir na ultima casa decimal
+    kd_ratios = np.array([round(ratio, 2) for ratio in (kills / deaths).tolist()], dtype=np.float64)
+
+    # Mesmas regras de calculate_classification
+    classifications = np.select(
+        [hours <= 10, (hours > 50) & (kd_ratios >= 2.0)],
+        ["Novato", "Elite"],
+        default="Veterano"
+    )
+    return list(zip(kd_ratios.tolist(), classifications.tolist()))
+
+def latest_pointer_update(player_data, processed_at):
+    """
+    Se o ponteiro player_latest (mantido pelo Scraper) aponta para este snapshot,
+    sobe a versao dele: e assim que a API sabe que a resposta em cache ficou velha.
+    """
+    return UpdateOne(
+        {"_id": player_data.get('player_name'), "document_id": player_data['_id']},
+        {"$set": {"analyzed_at": processed_at}, "$inc": {"version": 1}}
+    )
+
+def already_in_history(samples, player_data):
+    """True se o snapshot ja foi acrescentado ao historico (mensagem reentregue)"""
+    t = player_data.get('created_at', 0)
+    return any(sample[0] == t for sample in samples)
+
+def process_batch(ch, batch):
+    """
+    Analisa um lote de mensagens com 1 consulta ($in) e 1 bulk_write, e da ACK no lote todo.
+    O ponteiro player_latest e gravado por ultimo (como no callback): a API so ve a versao
+    nova quando a analise ja esta em raw_player_stats. Se o lote falhar no meio, ele volta
+    para a fila e e analisado de novo; o historico nao duplica.
+    """
+    last_tag = batch[-1][0]
     try:
-        message = json.loads(body)
-        document_id = message.get('document_id')
-        player_name = message.get('player_name')
+        document_ids = []
+        for _, body in batch:
+            try:
+                document_ids.append(ObjectId(json.loads(body)['document_id']))
+            except Exception as e:
+                print(f"Aviso: Mensagem invalida ignorada no lote: {e}")
 
-        # 1. Buscar os dados brutos no Banco
         db = get_db_connection()
         collection = db['raw_player_stats']
-        
-        # Buscamos pelo ID que o Scraper nos mandou
-        player_data = collection.find_one({"_id": ObjectId(document_id)})
-
-        if not player_data:
-            print("Erro: Jogador nao encontrado no banco.")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            return
-
-        # 2. Extrair metricas
-        stats = player_data.get('stats', {})
-        kills = stats.get('kills', 0)
-        deaths = stats.get('deaths', 1) # Evitar divisao por zero
-        if deaths == 0: deaths = 1
-        
-        hours = stats.get('time_played_hours', 0)
-
-        # 3. Calcular KD Ratio (Kills dividido por Deaths)
-        kd_ratio = round(kills / deaths, 2)
-
-        # 4. Definir Classificacao
-        rank_class = calculate_classification(kd_ratio, hours)
-
-        print(f"Processando {player_name}: KD={kd_ratio}, Horas={hours} -> Rank: {rank_class}")
-
-        # 5. Atualizar o documento no MongoDB com a analise
-        update_data = {
-            "analysis": {
+        documents = list(collection.find(
+            {"_id": {"$in": document_ids}},
+            {"player_name": 1, "platform": 1, "api_source": 1, "stats": 1, "created_at": 1, "enqueued_at": 1}
+        ))
+
+        # Historico recente de todos os jogadores do lote em uma consulta so
+        keys = {doc['_id']: player_key(doc.get('player_name'), doc.get('platform')) for doc in documents}
+        oldest = min((doc.get('created_at', 0) for doc in documents), default=0)
+        history = load_recent_history(db, set(keys.values()), oldest - max(TREND_WINDOWS.values()))
+
+        processed_at = time.time()
+        operations = []
+        ranking_operations = []
+        latest_operations = []
+        history_operations = []
+        for doc, (kd_ratio, rank_class) in zip(documents, analyze_batch(documents)):
+            analysis = {
                 "kd_ratio": kd_ratio,
                 "classification": rank_class,
-                "processed_at": time.time()
+                "trends": compute_trends(history.get(keys[doc['_id']], []), doc),
+                "processed_at": processed_at
             }
+            operations.append(UpdateOne({"_id": doc['_id']}, {"$set": {"analysis": analysis}}))
+            ranking_operations.append(leaderboard_update(doc, analysis))
+            latest_operations.append(latest_pointer_update(doc, processed_at))
+            if not already_in_history(history.get(keys[doc['_id']], []), doc):
+                history_operations.append(history_append(doc))
+
+        if history_operations:
+            with DB_WRITE_SECONDS.time(operation='history_append'):
+                db[HISTORY_COLLECTION].bulk_write(history_operations, ordered=False)
+        with DB_WRITE_SECONDS.time(operation='leaderboard'):
+            write_leaderboard(db, ranking_operations)
+        if operations:
+            with DB_WRITE_SECONDS.time(operation='analysis_update'):
+                collection.bulk_write(operations, ordered=False)
+            with DB_WRITE_SECONDS.time(operation='latest_pointer'):
+                db['player_latest'].bulk_write(latest_operations, ordered=False)
+
+        for doc in documents:
+            if doc.get('enqueued_at'):
+                PIPELINE_SECONDS.observe(processed_at - doc['enqueued_at'])
+        MESSAGES.inc(len(operations), stage='analyze', result='analisado')
+        MESSAGES.inc(len(batch) - len(operations), stage='analyze', result='ignorado')
+
+        print(f"Lote: {len(batch)} mensagens, {len(operations)} analises salvas no banco.")
+        ch.basic_ack(delivery_tag=last_tag, multiple=True)
+
+    except TRANSIENT_ERRORS as e:
+        # Falha passageira (ex: MongoDB fora do ar): o lote inteiro volta para a fila
+        print(f"Erro no Analyzer (lote): {e}. Lote devolvido para a fila.")
+        ERRORS.inc(stage='analyze')
+        ch.basic_nack(delivery_tag=last_tag, multiple=True, requeue=True)
+
+    except Exception as e:
+        # Erro inesperado: processa uma mensagem por vez para uma mensagem ruim nao levar o lote
+        print(f"Erro no Analyzer (lote): {e}. Reprocessando uma mensagem por vez.")
+        ERRORS.inc(stage='analyze')
+        for delivery_tag, body in batch:
+            try:
+                analyze_message(ch, delivery_tag, body)
+            except TRANSIENT_ERRORS as e:
+                print(f"Erro no Analyzer: {e}. Mensagem devolvida para a fila.")
+                ERRORS.inc(stage='analyze')
+                ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            except Exception as e:
+                ERRORS.inc(stage='analyze')
+                dead_letter(ch, delivery_tag, body, e)
+
+def dead_letter(ch, delivery_tag, body, error):
+    """Move a mensagem para a DEAD_LETTER_QUEUE (com o erro) e tira ela da fila de analise"""
+    try:
+        message = json.loads(body)
+    except ValueError:
+        message = {"body": body.decode('utf-8', errors='replace')}
+    message = dict(message, last_error=str(error), failed_at=time.time())
+    ch.basic_publish(
+        exchange='',
+        routing_key=DEAD_LETTER_QUEUE,
+        body=json.dumps(message),
+        properties=pika.BasicProperties(delivery_mode=2)
+    )
+    print(f"Aviso: mensagem de {message.get('player_name')} enviada para {DEAD_LETTER_QUEUE}: {error}")
+    MESSAGES.inc(stage='analyze', result='descartado')
+    ch.basic_ack(delivery_tag=delivery_tag)
+
+def callback(ch, method, properties, body):
+    try:
+        analyze_message(ch, method.delivery_tag, body)
+    except Exception as e:
+        print(f"Erro no Analyzer: {e}")
+        ERRORS.inc(stage='analyze')
+
+def analyze_message(ch, delivery_tag, body):
+    """Analisa uma mensagem e da ACK nela; erros sobem para quem chamou decidir o destino"""
+    print("Analyzer: Recebi uma tarefa!")
+    message = json.loads(body)
+    document_id = message.get('document_id')
+    player_name = message.get('player_name')
+
+    # 1. Buscar os dados brutos no Banco
+    db = get_db_connection()
+    collection = db['raw_player_stats']
+    
+    # Buscamos pelo ID que o Scraper nos mandou
+    player_data = collection.find_one({"_id": ObjectId(document_id)})
+
+    if not player_data:
+        print("Erro: Jogador nao encontrado no banco.")
+        MESSAGES.inc(stage='analyze', result='ignorado')
+        ch.basic_ack(delivery_tag=delivery_tag)
+        return
+
+    # 2. Extrair metricas
+    stats = player_data.get('stats', {})
+    kills = stats.get('kills', 0)
+    deaths = stats.get('deaths', 1) # Evitar divisao por zero
+    if deaths == 0: deaths = 1
+    
+    hours = stats.get('time_played_hours', 0)
+
+    # 3. Calcular KD Ratio (Kills dividido por Deaths)
+    kd_ratio = round(kills / deaths, 2)
+
+    # 4. Definir Classificacao
+    rank_class = calculate_classification(kd_ratio, hours)
+
+    print(f"Processando {player_name}: KD={kd_ratio}, Horas={hours} -> Rank: {rank_class}")
+
+    # 5. Variacao nos ultimos 7/30 dias, a partir do historico compacto
+    key = player_key(player_data.get('player_name'), player_data.get('platform'))
+    since = player_data.get('created_at', 0) - max(TREND_WINDOWS.values())
+    history = load_recent_history(db, [key], since)
+    trends = compute_trends(history.get(key, []), player_data)
+
+    # 6. Atualizar o documento no MongoDB com a analise
+    update_data = {
+        "analysis": {
+            "kd_ratio": kd_ratio,
+            "classification": rank_class,
+            "trends": trends,
+            "processed_at": time.time()
         }
+    }
 
+    with DB_WRITE_SECONDS.time(operation='analysis_update'):
         collection.update_one(
             {"_id": ObjectId(document_id)},
             {"$set": update_data}
         )
-        
-        print("Sucesso: Analise salva no banco.")
-        ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    except Exception as e:
-        print(f"Erro no Analyzer: {e}")
+    # 7. Acrescentar o snapshot ao historico do jogador (uma vez so, mesmo se a mensagem for reentregue)
+    if not already_in_history(history.get(key, []), player_data):
+        with DB_WRITE_SECONDS.time(operation='history_append'):
+            db[HISTORY_COLLECTION].bulk_write([history_append(player_data)])
+
+    # 8. Atualizar a entrada do jogador no ranking materializado
+    with DB_WRITE_SECONDS.time(operation='leaderboard'):
+        write_leaderboard(db, [leaderboard_update(player_data, update_data['analysis'])])
+
+    # 9. Sinalizar a API (cache do GET /player) que a analise chegou
+    with DB_WRITE_SECONDS.time(operation='latest_pointer'):
+        db['player_latest'].bulk_write([latest_pointer_update(player_data, update_data['analysis']['processed_at'])])
+
+    
+    # Latencia ponta a ponta: do enqueue na API ate a analise salva
+    if message.get('enqueued_at'):
+        PIPELINE_SECONDS.observe(update_data['analysis']['processed_at'] - message['enqueued_at'])
+    MESSAGES.inc(stage='analyze', result='analisado')
+
+    print("Sucesso: Analise salva no banco.")
+    ch.basic_ack(delivery_tag=delivery_tag)
 
 def start_analyzer():
     print("Iniciando Worker Analyzer...")
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+    ensure_indexes(get_db_connection())
+    PopulationSketches(get_db_connection(), SKETCH_REBUILD_SECONDS).start()
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST, virtual_host=RABBITMQ_VHOST))
     channel = connection.channel()
     
     channel.queue_declare(queue=QUEUE_NAME, durable=True)
@@ -94,5 +304,50 @@ def start_analyzer():
     print(f"Aguardando mensagens na fila {QUEUE_NAME}...")
     channel.start_consuming()
 
+def start_batch_analyzer():
+    print(f"Iniciando Worker Analyzer (MODO LOTE - ate {ANALYZER_BATCH_SIZE} mensagens / {ANALYZER_BATCH_WAIT_MS} ms)...")
+    ensure_indexes(get_db_connection())
+    PopulationSketches(get_db_connection(), SKETCH_REBUILD_SECONDS).start()
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST, virtual_host=RABBITMQ_VHOST))
+    channel = connection.channel()
+
+    channel.queue_declare(queue=QUEUE_NAME, durable=True)
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
+    channel.basic_qos(prefetch_count=ANALYZER_BATCH_SIZE)
+
+    print(f"Aguardando mensagens na fila {QUEUE_NAME}...")
+    wait_seconds = ANALYZER_BATCH_WAIT_MS / 1000
+    batch = []
+    deadline = 0
+    # inactivity_timeout faz o consume devolver (None, None, None) quando a fila esta parada,
+    # assim conseguimos fechar o lote pelo tempo
+    for method, properties, body in channel.consume(QUEUE_NAME, inactivity_timeout=wait_seconds):
+        if method is not None:
+            if not batch:
+                deadline = time.monotonic() + wait_seconds
+            batch.append((method.delivery_tag, body))
+
+        if batch and (len(batch) >= ANALYZER_BATCH_SIZE or time.monotonic() >= deadline):
+            process_batch(channel, batch)
+            batch = []
+
+def start_metrics_server():
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metricas em http://localhost:{METRICS_PORT}/metrics")
+
 if __name__ == '__main__':
-    start_analyzer()
\ No newline at end of file
+    if '--rebuild-leaderboard' in sys.argv:
+        print("Recriando o ranking a partir de raw_player_stats...")
+        rebuild_leaderboard(get_db_connection())
+        print("Sucesso: Ranking recriado.")
+    elif '--rebuild-sketches' in sys.argv:
+        print("Recriando os sketches de percentis a partir do ranking...")
+        rebuild_sketches(get_db_connection())
+        print("Sucesso: Sketches recriados.")
+    elif ANALYZER_BATCH_SIZE > 1:
+        start_metrics_server()
+        start_batch_analyzer()
+    else:
+        start_metrics_server()
+        start_analyzer()
\ No newline at end of file
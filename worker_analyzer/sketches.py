@@ -0,0 +1,93 @@
+import threading
+import time
+
+from common.tdigest import TDigest
+
+# Metricas acompanhadas por plataforma para calcular percentis da populacao
+METRICS = ("kd_ratio", "accuracy_percent", "time_played_hours")
+SKETCHES_COLLECTION = 'population_sketches'
+
+
+def leaderboard_values(doc):
+    """Valores de um jogador do ranking que entram nos sketches"""
+    return {
+        "kd_ratio": doc.get('analysis', {}).get('kd_ratio'),
+        "accuracy_percent": doc.get('stats', {}).get('accuracy_percent'),
+        "time_played_hours": doc.get('stats', {}).get('time_played_hours')
+    }
+
+def rebuild_sketches(db, compression=100):
+    """Recria os sketches a partir do ranking (um valor por jogador/plataforma)"""
+    # Marca ate onde o ranking foi lido: o proximo rebuild so roda se houver analise mais nova
+    newest = db['leaderboard'].find_one({}, {"analysis.processed_at": 1}, sort=[("analysis.processed_at", -1)])
+    source_processed_at = newest.get('analysis', {}).get('processed_at') if newest else None
+
+    digests = {}
+    projection = {"platform": 1, "stats": 1, "analysis": 1}
+    for doc in db['leaderboard'].find({}, projection).batch_size(1000):
+        for metric, value in leaderboard_values(doc).items():
+            if value is None:
+                continue
+            key = (doc.get('platform'), metric)
+            digests.setdefault(key, TDigest(compression)).add(float(value))
+
+    collection = db[SKETCHES_COLLECTION]
+    for (platform, metric), digest in digests.items():
+        data = digest.to_dict()
+        stored = collection.find_one({"_id": f"{platform}:{metric}"}, {"version": 1})
+        data.update({
+            "platform": platform,
+            "metric": metric,
+            "version": (stored.get('version', 0) if stored else 0) + 1,
+            "source_processed_at": source_processed_at,
+            "updated_at": time.time()
+        })
+        collection.replace_one({"_id": f"{platform}:{metric}"}, data, upsert=True)
+
+
+class PopulationSketches:
+    """
+    Mantem os sketches de population_sketches em dia com o ranking.
+
+    Os sketches sao recriados a partir do leaderboard, que tem uma entrada por
+    jogador/plataforma: o percentil mede a posicao entre jogadores, e nao entre
+    analises (jogadores atualizados com mais frequencia nao pesam mais). O
+    rebuild so acontece se o ranking recebeu analises depois do ultimo; com
+    varios Analyzers, o primeiro que reconstruir faz os outros pularem a vez.
+    start() faz a verificacao a cada rebuild_interval segundos em uma thread
+    propria, para a leitura do ranking nao travar o consumo da fila.
+    """
+
+    def __init__(self, db, rebuild_interval=300, compression=100):
+        self.db = db
+        self.rebuild_interval = rebuild_interval
+        self.compression = compression
+
+    def is_stale(self):
+        newest = self.db['leaderboard'].find_one(
+            {}, {"analysis.processed_at": 1}, sort=[("analysis.processed_at", -1)]
+        )
+        if not newest:
+            return False
+        built = self.db[SKETCHES_COLLECTION].find_one(
+            {}, {"source_processed_at": 1}, sort=[("source_processed_at", -1)]
+        )
+        built_at = built.get('source_processed_at') if built else None
+        return built_at is None or newest.get('analysis', {}).get('processed_at', 0) > built_at
+
+    def maybe_rebuild(self):
+        if not self.is_stale():
+            return False
+        rebuild_sketches(self.db, self.compression)
+        return True
+
+    def start(self):
+        threading.Thread(target=self._run, name='sketch-rebuild', daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.maybe_rebuild()
+            except Exception as e:
+                print(f"Erro ao recriar sketches de percentis: {e}")
+            time.sleep(self.rebuild_interval)
@@ -0,0 +1,189 @@
+import pika
+import json
+import os
+import sys
+import time
+from pika.exceptions import AMQPError
+from pymongo import MongoClient, UpdateOne
+
+# Permite importar o pacote compartilhado 'common' (raiz do projeto)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import ERRORS, MESSAGES, PUBLISH_SECONDS, CallbackMetric, start_http_server
+from common.indexes import ensure_indexes
+from common.tracking import TRACKED_COLLECTION
+from scheduler import RefreshPolicy, RefreshQueue
+
+# Configuracoes
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
+RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
+SCRAPING_QUEUE = 'scraping_queue'
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB = os.environ.get('MONGO_DB', 'bf_stats_db')
+
+# Buscas por segundo enviadas para a scraping_queue (espacadas igualmente)
+SCHEDULER_RATE = float(os.environ.get('SCHEDULER_RATE', 2))
+# Intervalo entre buscas de um jogador pouco pedido e de um muito pedido
+REFRESH_BASE_SECONDS = float(os.environ.get('REFRESH_BASE_SECONDS', 6 * 3600))
+REFRESH_MIN_SECONDS = float(os.environ.get('REFRESH_MIN_SECONDS', 15 * 60))
+# Teto da espera de jogadores que falharam varias vezes seguidas
+REFRESH_MAX_BACKOFF_SECONDS = float(os.environ.get('REFRESH_MAX_BACKOFF_SECONDS', 7 * 86400))
+# A popularidade perde metade do peso a cada N dias sem pedidos
+POPULARITY_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 7))
+# Agendado sem resposta do Scraper por esse tempo: agenda de novo
+INFLIGHT_TIMEOUT_SECONDS = float(os.environ.get('INFLIGHT_TIMEOUT_SECONDS', 30 * 60))
+# De quanto em quanto tempo le do MongoDB os jogadores novos/atualizados
+SCHEDULER_SYNC_SECONDS = float(os.environ.get('SCHEDULER_SYNC_SECONDS', 10))
+# Com mais mensagens que isso na scraping_queue o Scheduler espera (nao empilha buscas)
+SCHEDULER_MAX_BACKLOG = int(os.environ.get('SCHEDULER_MAX_BACKLOG', 1000))
+# Porta do endpoint /metrics deste worker (0 desliga)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9103))
+
+policy = RefreshPolicy(
+    REFRESH_BASE_SECONDS, REFRESH_MIN_SECONDS, REFRESH_MAX_BACKOFF_SECONDS,
+    POPULARITY_HALF_LIFE_DAYS * 86400, INFLIGHT_TIMEOUT_SECONDS
+)
+refresh_queue = RefreshQueue()
+_backlog = 0
+_due = 0
+_client = None
+
+CallbackMetric('bf_scheduler_tracked_players', 'Jogadores acompanhados pelo Scheduler.',
+               lambda: len(refresh_queue))
+CallbackMetric('bf_scheduler_due_players', 'Jogadores vencidos aguardando agendamento na ultima sincronizacao.',
+               lambda: _due)
+CallbackMetric('bf_scheduler_scraping_backlog', 'Mensagens na scraping_queue na ultima leitura.',
+               lambda: _backlog)
+
+def get_db_connection():
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URI)
+    return _client[MONGO_DB]
+
+def sync_tracked(collection, since=None):
+    """Carrega no heap os jogadores alterados desde 'since' (todos, se None)"""
+    now = time.time()
+    query = {} if since is None else {"updated_at": {"$gte": since}}
+    count = 0
+    for doc in collection.find(query):
+        refresh_queue.push(
+            doc['_id'],
+            policy.due_at(doc, now),
+            policy.popularity(doc, now),
+            {"player_name": doc.get('player_name'), "platform": doc.get('platform')}
+        )
+        count += 1
+    return count
+
+def mark_scheduled(collection, scheduled):
+    """Grava o scheduled_at de cada jogador: lista de (key, momento da publicacao)"""
+    if scheduled:
+        collection.bulk_write(
+            [UpdateOne({"_id": key}, {"$set": {"scheduled_at": enqueued_at}}) for key, enqueued_at in scheduled],
+            ordered=False
+        )
+
+def scraping_backlog(channel):
+    global _backlog
+    _backlog = channel.queue_declare(queue=SCRAPING_QUEUE, durable=True).method.message_count
+    return _backlog
+
+def run_scheduler(connection, channel, collection):
+    global _backlog, _due
+    spacing = 1 / SCHEDULER_RATE
+    next_slot = time.monotonic()
+    # Le tudo na partida; depois so o que mudou (com folga para relogios e escritas lentas)
+    last_sync = time.time()
+    print(f"Scheduler: {sync_tracked(collection)} jogadores acompanhados carregados.")
+    _due = refresh_queue.due_count(time.time())
+    next_sync = time.monotonic() + SCHEDULER_SYNC_SECONDS
+    scheduled = []
+
+    try:
+        while True:
+            if time.monotonic() >= next_sync:
+                mark_scheduled(collection, scheduled)
+                scheduled = []
+                sync_started = time.time()
+                sync_tracked(collection, since=last_sync - SCHEDULER_SYNC_SECONDS)
+                last_sync = sync_started
+                next_sync = time.monotonic() + SCHEDULER_SYNC_SECONDS
+                scraping_backlog(channel)
+                # Contado aqui (loop principal): o /metrics roda em outra thread e nao pode varrer o heap
+                _due = refresh_queue.due_count(time.time())
+
+            if _backlog >= SCHEDULER_MAX_BACKLOG:
+                # Scraper atrasado: nao adianta empilhar mais buscas
+                connection.sleep(max(0.1, next_sync - time.monotonic()))
+                continue
+
+            now = time.time()
+            item = refresh_queue.pop_due(now)
+            if item is None:
+                # Nada vencido: dorme ate o proximo vencimento ou a proxima sincronizacao
+                if scheduled:
+                    mark_scheduled(collection, scheduled)
+                    scheduled = []
+                next_due = refresh_queue.next_due()
+                wait = next_sync - time.monotonic()
+                if next_due is not None:
+                    wait = min(wait, next_due - now)
+                connection.sleep(min(max(wait, 0.05), SCHEDULER_SYNC_SECONDS))
+                continue
+
+            # Espacamento fixo entre publicacoes: carga uniforme na GameTools
+            delay = next_slot - time.monotonic()
+            if delay > 0:
+                connection.sleep(delay)
+            next_slot = max(next_slot, time.monotonic()) + spacing
+
+            key, player = item
+            enqueued_at = time.time()
+            with PUBLISH_SECONDS.time(queue=SCRAPING_QUEUE):
+                channel.basic_publish(
+                    exchange='',
+                    routing_key=SCRAPING_QUEUE,
+                    body=json.dumps({
+                        "player_name": player['player_name'],
+                        "platform": player['platform'],
+                        "status": "pendente",
+                        "origin": "scheduler",
+                        "enqueued_at": enqueued_at
+                    }),
+                    properties=pika.BasicProperties(delivery_mode=2)
+                )
+            MESSAGES.inc(stage='schedule', result='agendado')
+            _backlog += 1
+
+            # Volta para o heap como agendado; a resposta do Scraper chega pela sincronizacao
+            refresh_queue.push(key, enqueued_at + INFLIGHT_TIMEOUT_SECONDS, 0, player)
+            scheduled.append((key, enqueued_at))
+            if len(scheduled) >= 100:
+                mark_scheduled(collection, scheduled)
+                scheduled = []
+    finally:
+        # Nao perde as marcacoes pendentes se a conexao com o RabbitMQ cair
+        mark_scheduled(collection, scheduled)
+
+def start_scheduler():
+    print(f"Iniciando Scheduler ({SCHEDULER_RATE} buscas/s na {SCRAPING_QUEUE})...")
+    db = get_db_connection()
+    ensure_indexes(db)
+    while True:
+        try:
+            connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST, virtual_host=RABBITMQ_VHOST))
+            channel = connection.channel()
+            channel.confirm_delivery()
+            scraping_backlog(channel)
+            run_scheduler(connection, channel, db[TRACKED_COLLECTION])
+        except AMQPError as e:
+            print(f"Erro no Scheduler (RabbitMQ): {e}. Reconectando em 5s...")
+            ERRORS.inc(stage='schedule')
+            time.sleep(5)
+
+if __name__ == '__main__':
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metricas em http://localhost:{METRICS_PORT}/metrics")
+    start_scheduler()
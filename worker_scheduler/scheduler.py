@@ -0,0 +1,105 @@
+import heapq
+import math
+
+
+class RefreshPolicy:
+    """
+    Decide quando cada jogador acompanhado deve ser buscado de novo.
+
+    O intervalo entre buscas cai com a popularidade (pedidos recentes na API):
+    base_interval para quem quase nao e pedido, ate min_interval para os mais
+    pedidos. A popularidade perde metade do peso a cada popularity_half_life
+    segundos sem novos pedidos. Jogadores com falhas seguidas esperam em dobro a
+    cada falha (ate max_backoff), e um jogador ja agendado so volta a ser
+    considerado depois de inflight_timeout se o Scraper nunca responder.
+    """
+
+    def __init__(self, base_interval, min_interval, max_backoff, popularity_half_life, inflight_timeout):
+        self.base_interval = base_interval
+        self.min_interval = min_interval
+        self.max_backoff = max_backoff
+        self.popularity_half_life = popularity_half_life
+        self.inflight_timeout = inflight_timeout
+
+    def popularity(self, doc, now):
+        popularity = doc.get('popularity', 0)
+        idle = max(0.0, now - (doc.get('last_requested_at') or now))
+        if self.popularity_half_life > 0:
+            popularity *= 0.5 ** (idle / self.popularity_half_life)
+        return popularity
+
+    def interval(self, popularity):
+        return max(self.min_interval, self.base_interval / (1 + math.log2(1 + popularity)))
+
+    def due_at(self, doc, now):
+        """Momento (epoch) em que o jogador fica velho o bastante para uma nova busca"""
+        interval = self.interval(self.popularity(doc, now))
+        last_fetched = doc.get('last_fetched_at')
+        last_attempt = doc.get('last_attempt_at') or last_fetched
+        failures = doc.get('failures', 0)
+
+        if failures:
+            due = last_attempt + min(interval * 2 ** (failures - 1), self.max_backoff)
+        elif last_fetched:
+            due = last_fetched + interval
+        else:
+            # Nunca buscado: vence na hora
+            due = 0.0
+
+        # Ja enfileirado e ainda sem resposta do Scraper
+        scheduled_at = doc.get('scheduled_at')
+        if scheduled_at and scheduled_at > (last_attempt or 0):
+            due = max(due, scheduled_at + self.inflight_timeout)
+        return due
+
+
+class RefreshQueue:
+    """
+    Fila de prioridade (heap) dos jogadores acompanhados, ordenada pelo momento
+    em que cada um vence; no empate, o mais popular sai primeiro.
+
+    Atualizar um jogador so empurra uma entrada nova: as antigas ficam no heap
+    e sao descartadas quando chegam ao topo (versao diferente da atual).
+    """
+
+    def __init__(self):
+        self._heap = []
+        # key -> (versao, due_at, jogador)
+        self._entries = {}
+        self._version = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def push(self, key, due_at, popularity, player):
+        self._version += 1
+        self._entries[key] = (self._version, due_at, player)
+        heapq.heappush(self._heap, (due_at, -popularity, self._version, key))
+        # Muitas entradas velhas acumuladas: reconstroi o heap so com as atuais
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = [item for item in self._heap if self._entries.get(item[3], (None,))[0] == item[2]]
+            heapq.heapify(self._heap)
+
+    def _drop_stale(self):
+        while self._heap:
+            due_at, _, version, key = self._heap[0]
+            if self._entries.get(key, (None,))[0] == version:
+                return
+            heapq.heappop(self._heap)
+
+    def next_due(self):
+        """Momento em que vence o proximo jogador (None se a fila estiver vazia)"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove e retorna (key, jogador) do mais urgente ja vencido, ou None"""
+        self._drop_stale()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        _, _, _, key = heapq.heappop(self._heap)
+        _, _, player = self._entries.pop(key)
+        return key, player
+
+    def due_count(self, now):
+        return sum(1 for _, due_at, _ in self._entries.values() if due_at <= now)
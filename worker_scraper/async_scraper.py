@@ -0,0 +1,339 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from pika.exceptions import AMQPConnectionError
+from pymongo import MongoClient
+
+from cache import InFlightRequests
+from common.metrics import DB_WRITE_SECONDS, ERRORS, FETCH_SECONDS, MESSAGES, PUBLISH_SECONDS
+from common.players import player_key
+from common.tracking import TRACKED_COLLECTION, record_fetch
+from gametools import REQUEST_TIMEOUT, parse_battlefield_stats, stats_params, stats_url
+from retry import DEAD_LETTER_QUEUE, TransientFetchError, next_route, retry_queues
+from snapshots import save_snapshot
+
+
+class TokenBucket:
+    """Limita a taxa de requisicoes: 'rate' fichas por segundo, acumulando no maximo 'capacity'"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # O lock mantem a fila de espera em ordem de chegada
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncScraper:
+    """
+    Worker Scraper assincrono: consome a scraping_queue com prefetch = concurrency
+    e processa varias buscas na GameTools ao mesmo tempo, usando uma unica sessao
+    HTTP (keep-alive). A mensagem so recebe ACK depois que o documento foi salvo
+    no MongoDB e o broker confirmou a publicacao na fila de analise.
+
+    Mensagens simultaneas do mesmo jogador viram uma unica busca, e buscas
+    recentes sao respondidas pelo cache (PlayerCache) quando ele e informado.
+    Falhas passageiras voltam para a fila pelas filas de nova tentativa (retry.py).
+    """
+
+    def __init__(self, rabbitmq_host, mongo_uri, scraping_queue, analysis_queue,
+                 concurrency=16, rate_limit=10, rate_burst=20, db_name='bf_stats_db',
+                 cache=None, rabbitmq_vhost='/'):
+        self.rabbitmq_host = rabbitmq_host
+        self.rabbitmq_vhost = rabbitmq_vhost
+        self.mongo_uri = mongo_uri
+        self.scraping_queue = scraping_queue
+        self.analysis_queue = analysis_queue
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        self.db_name = db_name
+        self.cache = cache
+
+        self._inflight = InFlightRequests()
+        self._buckets = {}
+        self._tasks = set()
+        self._pending_confirms = {}
+        self._publish_seq = 0
+        self._session = None
+        self._channel = None
+
+    def http_session(self):
+        """Sessao HTTP compartilhada, com no maximo 'concurrency' conexoes abertas"""
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+        )
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._closed = self._loop.create_future()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._db = MongoClient(self.mongo_uri)[self.db_name]
+
+        async with self.http_session() as session:
+            self._session = session
+            connection = await self._connect()
+            try:
+                self._channel = await self._open_channel(connection)
+                print(f"Aguardando mensagens na fila {self.scraping_queue}...")
+                reason = await self._closed
+                print(f"Conexao com o RabbitMQ encerrada: {reason}")
+            finally:
+                for task in list(self._tasks):
+                    task.cancel()
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+                if connection.is_open:
+                    connection.close()
+                self._executor.shutdown(wait=False)
+
+    # --- HTTP ---
+
+    def _bucket_for(self, url):
+        if self.rate_limit <= 0:
+            return None
+        host = urlsplit(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate_limit, self.rate_burst)
+        return self._buckets[host]
+
+    async def fetch(self, player_name, platform):
+        """Versao assincrona de fetch_battlefield_stats (mesmo retorno e mesmas excecoes)"""
+        url = stats_url()
+        bucket = self._bucket_for(url)
+        if bucket:
+            await bucket.acquire()
+
+        started = time.perf_counter()
+        result = 'erro'
+        try:
+            async with self._session.get(url, params=stats_params(player_name, platform)) as response:
+                if response.status == 404:
+                    print(f"Erro: Jogador {player_name} não encontrado no BF6.")
+                    result = 'nao_encontrado'
+                    return None
+
+                if response.status != 200:
+                    print(f"Erro API BF6: {response.status}")
+                    result = f'http_{response.status}'
+                    raise TransientFetchError(f"HTTP {response.status}")
+
+                api_data = await response.json(content_type=None)
+
+            data = parse_battlefield_stats(player_name, platform, api_data)
+            result = 'ok'
+            return data
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Exceção ao conectar na API BF6: {e}")
+            raise TransientFetchError(str(e)) from e
+
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - started, result=result)
+            if result not in ('ok', 'nao_encontrado'):
+                ERRORS.inc(stage='fetch')
+
+    # --- RabbitMQ ---
+
+    def _connect(self):
+        opened = self._loop.create_future()
+
+        def on_open(connection):
+            opened.set_result(connection)
+
+        def on_open_error(connection, error):
+            if not isinstance(error, BaseException):
+                error = AMQPConnectionError(error)
+            opened.set_exception(error)
+
+        def on_close(connection, reason):
+            self._on_closed(reason)
+
+        AsyncioConnection(
+            pika.ConnectionParameters(host=self.rabbitmq_host, virtual_host=self.rabbitmq_vhost),
+            on_open_callback=on_open,
+            on_open_error_callback=on_open_error,
+            on_close_callback=on_close,
+            custom_ioloop=self._loop
+        )
+        return opened
+
+    def _call(self, method, **kwargs):
+        """Transforma uma chamada com callback do pika em um future"""
+        future = self._loop.create_future()
+        method(callback=lambda frame: future.done() or future.set_result(frame), **kwargs)
+        return future
+
+    async def _open_channel(self, connection):
+        opened = self._loop.create_future()
+        connection.channel(on_open_callback=opened.set_result)
+        channel = await opened
+        channel.add_on_close_callback(lambda ch, reason: self._on_closed(reason))
+
+        await self._call(channel.queue_declare, queue=self.scraping_queue, durable=True)
+        await self._call(channel.queue_declare, queue=self.analysis_queue, durable=True)
+        for queue, arguments in retry_queues(self.scraping_queue):
+            await self._call(channel.queue_declare, queue=queue, durable=True, arguments=arguments)
+        await self._call(channel.queue_declare, queue=DEAD_LETTER_QUEUE, durable=True)
+        await self._call(channel.basic_qos, prefetch_count=self.concurrency)
+        await self._call(channel.confirm_delivery, ack_nack_callback=self._on_confirm)
+        channel.basic_consume(queue=self.scraping_queue, on_message_callback=self._on_message)
+        return channel
+
+    def _on_closed(self, reason):
+        if not self._closed.done():
+            self._closed.set_result(reason)
+        for future in self._pending_confirms.values():
+            if not future.done():
+                future.set_exception(AMQPConnectionError(reason))
+        self._pending_confirms.clear()
+
+    def _on_confirm(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = [tag for tag in self._pending_confirms if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+
+        for tag in tags:
+            future = self._pending_confirms.pop(tag, None)
+            if future is None or future.done():
+                continue
+            if acked:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError("Broker recusou a mensagem de analise (nack)."))
+
+    def _publish(self, queue, payload):
+        """Publica na fila e retorna um future resolvido pela confirmacao do broker"""
+        confirmed = self._loop.create_future()
+        self._channel.basic_publish(
+            exchange='',
+            routing_key=queue,
+            body=json.dumps(payload),
+            properties=pika.BasicProperties(delivery_mode=2)
+        )
+        self._publish_seq += 1
+        self._pending_confirms[self._publish_seq] = confirmed
+        return confirmed
+
+    def _on_message(self, channel, method, properties, body):
+        task = self._loop.create_task(self._handle(method.delivery_tag, body))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _save_snapshot(self, data):
+        # Roda no executor: mede so a escrita, sem o tempo de espera na fila de threads
+        with DB_WRITE_SECONDS.time(operation='insert_snapshot'):
+            return save_snapshot(self._db, data)
+
+    async def _refresh(self, player, platform, enqueued_at=None):
+        """Busca, salva e envia para analise; retorna a entrada de cache ou None"""
+        if self.cache:
+            cached = await self._loop.run_in_executor(self._executor, self.cache.get, player, platform)
+            if cached:
+                print(f"Cache: {player} buscado recentemente (doc {cached['document_id']}), busca ignorada. {self.cache.stats()}")
+                MESSAGES.inc(stage='scrape', result='cache')
+                await self._record_fetch(player, platform, time.time(), fetched_at=cached['created_at'])
+                return cached
+
+        print(f"Scraper: Iniciando busca para {player}...")
+        data = await self.fetch(player, platform)
+        if not data:
+            # Jogador inexistente: tentar de novo nao adianta
+            print("Aviso: Jogador nao encontrado na GameTools, busca descartada.")
+            MESSAGES.inc(stage='scrape', result='nao_encontrado')
+            await self._record_fetch(player, platform, time.time(), error='nao_encontrado')
+            return None
+
+        data['created_at'] = time.time()
+        data['enqueued_at'] = enqueued_at
+        inserted_id = await self._loop.run_in_executor(self._executor, self._save_snapshot, data)
+        document_id = str(inserted_id)
+
+        # Inclui a espera pela confirmacao do broker
+        with PUBLISH_SECONDS.time(queue=self.analysis_queue):
+            await self._publish(self.analysis_queue, {
+                "player_name": player,
+                "document_id": document_id,
+                "enqueued_at": enqueued_at
+            })
+        print(f"Sucesso: {player} salvo no MongoDB e enviado para fila de analise.")
+        MESSAGES.inc(stage='scrape', result='coletado')
+
+        entry = {"document_id": document_id, "created_at": data['created_at']}
+        if self.cache:
+            await self._loop.run_in_executor(self._executor, self.cache.put, player, platform, entry)
+        await self._record_fetch(player, platform, data['created_at'])
+        return entry
+
+    def _record_fetch(self, player, platform, now, error=None, fetched_at=None):
+        return self._loop.run_in_executor(
+            self._executor,
+            lambda: record_fetch(self._db[TRACKED_COLLECTION], player, platform, now,
+                                 error=error, fetched_at=fetched_at)
+        )
+
+    async def _schedule_retry(self, message, error):
+        """Manda a mensagem para a fila de espera da proxima tentativa (ou para a dead-letter)"""
+        queue, message = next_route(self.scraping_queue, message, error)
+        await self._publish(queue, message)
+        if queue == DEAD_LETTER_QUEUE:
+            print(f"Aviso: {message.get('player_name')} falhou {message['attempt']} vezes, enviado para {DEAD_LETTER_QUEUE}.")
+            MESSAGES.inc(stage='scrape', result='descartado')
+            await self._record_fetch(message.get('player_name'), message.get('platform'), time.time(), error=str(error))
+        else:
+            print(f"Aviso: nova tentativa ({message['attempt']}) de {message.get('player_name')} agendada em {queue}.")
+            MESSAGES.inc(stage='scrape', result='retry')
+
+    async def _refresh_or_retry(self, message):
+        """
+        Roda o _refresh; se ele falhar, agenda a nova tentativa. Roda uma vez por
+        jogador mesmo com varias mensagens juntadas: uma falha gera uma unica retry.
+        """
+        try:
+            return await self._refresh(message.get('player_name'), message.get('platform'), message.get('enqueued_at'))
+        except Exception as e:
+            if not isinstance(e, TransientFetchError):
+                print(f"Erro critico no Scraper: {e}")
+                ERRORS.inc(stage='scrape')
+            # Falha passageira (GameTools, MongoDB): tenta de novo mais tarde
+            await self._schedule_retry(message, e)
+            return None
+
+    async def _handle(self, delivery_tag, body):
+        async with self._semaphore:
+            try:
+                message = json.loads(body)
+                await self._inflight.run(
+                    player_key(message.get('player_name'), message.get('platform')),
+                    lambda: self._refresh_or_retry(message)
+                )
+                self._channel.basic_ack(delivery_tag=delivery_tag)
+
+            except Exception as e:
+                # JSON invalido (tentar de novo nao adianta) ou falha ao agendar a nova tentativa
+                print(f"Erro critico no Scraper: {e}")
+                ERRORS.inc(stage='scrape')
+                if self._channel.is_open:
+                    self._channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
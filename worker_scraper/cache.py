@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from common.players import player_key
+
+
+class PlayerCache:
+    """
+    Cache das ultimas buscas por (player_name, platform).
+
+    Guarda apenas a referencia ao documento salvo em raw_player_stats. Enquanto a
+    entrada estiver valida (TTL), uma nova requisicao do mesmo jogador nao chama a
+    GameTools nem gera novo documento/analise. Em memoria e LRU (max_entries);
+    opcionalmente consulta uma camada persistente (MongoCacheLayer) nos misses.
+    """
+
+    def __init__(self, ttl, max_entries=10000, persistent=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self.persistent_hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, player_name, platform):
+        key = player_key(player_name, platform)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.persistent is not None:
+            found = self.persistent.get(key)
+            if found is not None:
+                expires_at, value = found
+                with self._lock:
+                    self._store(key, expires_at, value)
+                    self.hits += 1
+                    self.persistent_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, player_name, platform, value):
+        key = player_key(player_name, platform)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, expires_at, value)
+        if self.persistent is not None:
+            self.persistent.put(key, expires_at, value)
+
+    def _store(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "persistent_hits": self.persistent_hits,
+                "size": len(self._entries),
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0
+            }
+
+
+class MongoCacheLayer:
+    """Camada persistente do cache: sobrevive a reinicios e e compartilhada entre workers"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        # O MongoDB apaga sozinho as entradas vencidas
+        collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def get(self, key):
+        doc = self.collection.find_one({"_id": key})
+        if not doc:
+            return None
+        # O monitor de TTL roda a cada ~60s, entao conferimos a validade aqui tambem
+        expires_at = doc['expires_at'].replace(tzinfo=timezone.utc).timestamp()
+        if expires_at <= time.time():
+            return None
+        return expires_at, doc['value']
+
+    def put(self, key, expires_at, value):
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc)},
+            upsert=True
+        )
+
+
+class InFlightRequests:
+    """Junta chamadas simultaneas para a mesma chave em uma unica execucao (modo assincrono)"""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._tasks = {}
+
+    async def run(self, key, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: cancelar quem esta esperando nao cancela a busca dos demais
+        return await asyncio.shield(task)
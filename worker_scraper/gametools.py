@@ -0,0 +1,49 @@
+import os
+
+# Pode apontar para um servidor local (stub) em testes e benchmarks
+GAMETOOLS_URL = os.environ.get('GAMETOOLS_URL', 'https://api.gametools.network')
+REQUEST_TIMEOUT = 15
+
+def stats_url():
+    """
+    Rota de estatisticas do BATTLEFIELD 6 na GameTools API.
+    Docs: https://api.gametools.network/docs#/Battlefield%206/bf6player_bf6_player__get
+    """
+    # DICA: Se der erro 404, tente mudar '/stats/' para '/player/' na URL abaixo,
+    # pois o nome do endpoint na documentação é "bf6_player".
+    return f"{GAMETOOLS_URL.rstrip('/')}/bf6/stats/"
+
+def stats_params(player_name, platform):
+    # IMPORTANTE:
+    # O BF6 é focado na nova geração. As plataformas geralmente são:
+    # 'pc', 'ps5', 'xboxseries' (verifique se 'xbox' funciona para Series S/X)
+    return {"name": player_name, "platform": platform}
+
+def parse_battlefield_stats(player_name, platform, api_data):
+    """Converte a resposta da GameTools no documento salvo em raw_player_stats"""
+    # O BF6 pode retornar o tempo em milissegundos ou segundos.
+    # Ajuste a divisão se o número de horas ficar estranho.
+    seconds_played = api_data.get('secondsPlayed', 0)
+    hours_played = round(seconds_played / 3600, 2)
+
+    return {
+        "player_name": player_name,
+        "platform": platform,
+        "api_source": "GameTools_BF6_Real",
+        "stats": {
+            # Campos comuns do BF (confirme se os nomes das chaves são iguais no JSON do BF6)
+            "kills": api_data.get('kills', 0),
+            "deaths": api_data.get('deaths', 0),
+            "wins": api_data.get('wins', 0),
+            "losses": api_data.get('loses', 0),
+
+            # Tratamento de erro caso o campo venha vazio ou diferente
+            "accuracy_percent": float(str(api_data.get('accuracy', '0')).replace('%','')),
+
+            "time_played_hours": hours_played,
+            "headshots": api_data.get('headshots', 0),
+
+            # BF6 tem classes novas, podemos tentar pegar a classe favorita se a API mandar
+            "favorite_class": api_data.get('classes', [{}])[0].get('class_name', 'Unknown') if api_data.get('classes') else "N/A"
+        }
+    }
@@ -1,137 +1,261 @@
 import pika
 import json
+import os
+import sys
 import time
 import requests
 from pymongo import MongoClient
 
+# Permite importar o pacote compartilhado 'common' (raiz do projeto)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.metrics import (
+    DB_WRITE_SECONDS, ERRORS, FETCH_SECONDS, MESSAGES, PUBLISH_SECONDS, CallbackMetric, start_http_server
+)
+from common.indexes import ensure_indexes
+from common.tracking import TRACKED_COLLECTION, record_fetch
+from cache import MongoCacheLayer, PlayerCache
+from gametools import REQUEST_TIMEOUT, parse_battlefield_stats, stats_params, stats_url
+from retry import DEAD_LETTER_QUEUE, TransientFetchError, next_route, retry_queues
+from snapshots import save_snapshot
+
 # Configuracoes
-RABBITMQ_HOST = 'localhost'
+RABBITMQ_HOST = os.environ.get('RABBITMQ_HOST', 'localhost')
+RABBITMQ_VHOST = os.environ.get('RABBITMQ_VHOST', '/')
 SCRAPING_QUEUE = 'scraping_queue'
 ANALYSIS_QUEUE = 'analysis_queue'
-MONGO_URI = 'mongodb://localhost:27017/'
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/')
+MONGO_DB = os.environ.get('MONGO_DB', 'bf_stats_db')
+
+# Modo assincrono: 'python worker_scraper/main.py --async' ou SCRAPER_MODE=async
+SCRAPER_MODE = os.environ.get('SCRAPER_MODE', 'sync')
+# Buscas simultaneas na GameTools (tambem vira o prefetch do consumidor)
+SCRAPER_CONCURRENCY = int(os.environ.get('SCRAPER_CONCURRENCY', 16))
+# Limite de requisicoes por segundo por host (token bucket) e rajada maxima
+SCRAPER_RATE_LIMIT = float(os.environ.get('SCRAPER_RATE_LIMIT', 10))
+SCRAPER_RATE_BURST = int(os.environ.get('SCRAPER_RATE_BURST', 20))
+# Cache de buscas recentes: dentro do TTL o jogador nao e buscado de novo (0 desliga)
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', 300))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 10000))
+# Liga a camada persistente (colecao player_fetch_cache) compartilhada entre workers
+CACHE_PERSISTENT = os.environ.get('CACHE_PERSISTENT', '0') == '1'
+# Porta do endpoint /metrics deste worker (0 desliga)
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9101))
+
+_client = None
+# Sessao HTTP reaproveitada entre buscas (keep-alive com a GameTools)
+_http = requests.Session()
 
 def get_db_connection():
-    client = MongoClient(MONGO_URI)
-    return client['bf_stats_db']
+    # Reaproveita o mesmo MongoClient entre mensagens
+    global _client
+    if _client is None:
+        _client = MongoClient(MONGO_URI)
+    return _client[MONGO_DB]
+
+_cache = None
+
+def get_cache():
+    """Cria (uma vez) o cache de buscas recentes, ou None se estiver desligado"""
+    global _cache
+    if _cache is None and CACHE_TTL_SECONDS > 0:
+        persistent = None
+        if CACHE_PERSISTENT:
+            persistent = MongoCacheLayer(get_db_connection()['player_fetch_cache'])
+        _cache = PlayerCache(CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, persistent)
+        register_cache_metrics(_cache)
+    return _cache
+
+def register_cache_metrics(cache):
+    CallbackMetric('bf_scraper_cache_hits_total', 'Buscas respondidas pelo cache.',
+                   lambda: cache.hits, kind='counter')
+    CallbackMetric('bf_scraper_cache_misses_total', 'Buscas que nao estavam no cache.',
+                   lambda: cache.misses, kind='counter')
+    CallbackMetric('bf_scraper_cache_entries', 'Entradas no cache em memoria.',
+                   lambda: cache.stats()['size'])
 
 def fetch_battlefield_stats(player_name, platform):
     """
     CONEXAO REAL: Busca dados na GameTools API para BATTLEFIELD 6.
     Docs: https://api.gametools.network/docs#/Battlefield%206/bf6player_bf6_player__get
+
+    Retorna None se o jogador nao existe e levanta TransientFetchError quando
+    vale tentar de novo (erro HTTP, timeout, falha de conexao).
     """
     print(f"DEBUG: Buscando dados BF6 para {player_name} ({platform})...")
-    
-    # IMPORTANTE: 
-    # O BF6 é focado na nova geração. As plataformas geralmente são:
-    # 'pc', 'ps5', 'xboxseries' (verifique se 'xbox' funciona para Series S/X)
-    
-    # Tentativa padrão na rota de estatísticas
-    url = f"https://api.gametools.network/bf6/stats/?name={player_name}&platform={platform}"
-    
-    # DICA: Se der erro 404, tente mudar '/stats/' para '/player/' na URL acima,
-    # pois o nome do endpoint na documentação que você mandou é "bf6_player".
 
+    started = time.perf_counter()
+    result = 'erro'
     try:
-        response = requests.get(url, timeout=15)
+        response = _http.get(
+            stats_url(),
+            params=stats_params(player_name, platform),
+            timeout=REQUEST_TIMEOUT
+        )
         
         if response.status_code == 404:
             print(f"Erro: Jogador {player_name} não encontrado no BF6.")
+            result = 'nao_encontrado'
             return None
             
         if response.status_code != 200:
             print(f"Erro API BF6: {response.status_code}")
-            return None
+            result = f'http_{response.status_code}'
+            raise TransientFetchError(f"HTTP {response.status_code}")
 
-        api_data = response.json()
-        
-        # O BF6 pode retornar o tempo em milissegundos ou segundos. 
-        # Ajuste a divisão se o número de horas ficar estranho.
-        seconds_played = api_data.get('secondsPlayed', 0)
-        hours_played = round(seconds_played / 3600, 2)
-
-        return {
-            "player_name": player_name,
-            "platform": platform,
-            "api_source": "GameTools_BF6_Real",
-            "stats": {
-                # Campos comuns do BF (confirme se os nomes das chaves são iguais no JSON do BF6)
-                "kills": api_data.get('kills', 0),
-                "deaths": api_data.get('deaths', 0),
-                "wins": api_data.get('wins', 0),
-                "losses": api_data.get('loses', 0),
-                
-                # Tratamento de erro caso o campo venha vazio ou diferente
-                "accuracy_percent": float(str(api_data.get('accuracy', '0')).replace('%','')),
-                
-                "time_played_hours": hours_played,
-                "headshots": api_data.get('headshots', 0),
-                
-                # BF6 tem classes novas, podemos tentar pegar a classe favorita se a API mandar
-                "favorite_class": api_data.get('classes', [{}])[0].get('class_name', 'Unknown') if api_data.get('classes') else "N/A"
-            }
-        }
+        data = parse_battlefield_stats(player_name, platform, response.json())
+        result = 'ok'
+        return data
 
-    except Exception as e:
+    except (requests.RequestException, ValueError) as e:
         print(f"Exceção ao conectar na API BF6: {e}")
-        return None
+        raise TransientFetchError(str(e)) from e
+
+    finally:
+        FETCH_SECONDS.observe(time.perf_counter() - started, result=result)
+        if result not in ('ok', 'nao_encontrado'):
+            ERRORS.inc(stage='fetch')
+
+def schedule_retry(ch, message, error):
+    """Manda a mensagem para a fila de espera da proxima tentativa (ou para a dead-letter)"""
+    queue, message = next_route(SCRAPING_QUEUE, message, error)
+    ch.basic_publish(
+        exchange='',
+        routing_key=queue,
+        body=json.dumps(message),
+        properties=pika.BasicProperties(delivery_mode=2)
+    )
+    if queue == DEAD_LETTER_QUEUE:
+        print(f"Aviso: {message.get('player_name')} falhou {message['attempt']} vezes, enviado para {DEAD_LETTER_QUEUE}.")
+        MESSAGES.inc(stage='scrape', result='descartado')
+        record_fetch(get_db_connection()[TRACKED_COLLECTION], message.get('player_name'),
+                     message.get('platform'), time.time(), error=str(error))
+    else:
+        print(f"Aviso: nova tentativa ({message['attempt']}) de {message.get('player_name')} agendada em {queue}.")
+        MESSAGES.inc(stage='scrape', result='retry')
 
 def callback(ch, method, properties, body):
+    message = None
     try:
         message = json.loads(body)
         player = message.get('player_name')
         platform = message.get('platform') # pc, ps5, xbox
         
+        cache = get_cache()
+        cached = cache.get(player, platform) if cache else None
+        if cached:
+            # Dados ainda frescos: nao chama a GameTools nem gera nova analise
+            print(f"Cache: {player} buscado recentemente (doc {cached['document_id']}), busca ignorada. {cache.stats()}")
+            MESSAGES.inc(stage='scrape', result='cache')
+            record_fetch(get_db_connection()[TRACKED_COLLECTION], player, platform, time.time(),
+                         fetched_at=cached['created_at'])
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
         print(f"Scraper: Iniciando busca para {player}...")
 
         # CHAMADA REAL AQUI
-        data = fetch_battlefield_stats(player, platform)
+        try:
+            data = fetch_battlefield_stats(player, platform)
+        except TransientFetchError as e:
+            # Falha passageira: tenta de novo mais tarde (backoff exponencial)
+            schedule_retry(ch, message, e)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
 
+        db = get_db_connection()
         if data:
-            # Salvar no MongoDB
-            db = get_db_connection()
-            collection = db['raw_player_stats']
+            # Salvar no MongoDB (snapshot + ponteiro para o mais recente)
             data['created_at'] = time.time()
+            data['enqueued_at'] = message.get('enqueued_at')
             
-            result = collection.insert_one(data)
-            document_id = str(result.inserted_id)
+            with DB_WRITE_SECONDS.time(operation='insert_snapshot'):
+                document_id = str(save_snapshot(db, data))
             print("Sucesso: Dados REAIS salvos no MongoDB.")
 
             # Avisar o Analyzer
             analysis_payload = {
                 "player_name": player,
-                "document_id": document_id
+                "document_id": document_id,
+                "enqueued_at": message.get('enqueued_at')
             }
 
-            ch.queue_declare(queue=ANALYSIS_QUEUE, durable=True)
-            ch.basic_publish(
-                exchange='',
-                routing_key=ANALYSIS_QUEUE,
-                body=json.dumps(analysis_payload),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
+            with PUBLISH_SECONDS.time(queue=ANALYSIS_QUEUE):
+                ch.queue_declare(queue=ANALYSIS_QUEUE, durable=True)
+                ch.basic_publish(
+                    exchange='',
+                    routing_key=ANALYSIS_QUEUE,
+                    body=json.dumps(analysis_payload),
+                    properties=pika.BasicProperties(delivery_mode=2)
+                )
             print("Sucesso: Enviado para fila de analise.")
+            MESSAGES.inc(stage='scrape', result='coletado')
+
+            if cache:
+                cache.put(player, platform, {"document_id": document_id, "created_at": data['created_at']})
+            record_fetch(db[TRACKED_COLLECTION], player, platform, data['created_at'])
         
         else:
-            print("Aviso: Nao foi possivel coletar dados (Jogador nao existe ou API offline).")
+            # Jogador inexistente: tentar de novo nao adianta
+            print("Aviso: Jogador nao encontrado na GameTools, busca descartada.")
+            MESSAGES.inc(stage='scrape', result='nao_encontrado')
+            record_fetch(db[TRACKED_COLLECTION], player, platform, time.time(), error='nao_encontrado')
 
-        # Sempre damos o ACK, mesmo se falhar a busca, para tirar a mensagem da fila
-        # Num sistema real, poderiamos mandar para uma fila de "retry" (tentar de novo)
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
     except Exception as e:
         print(f"Erro critico no Scraper: {e}")
-        # Se der erro de codigo, nao damos ACK para tentar de novo ou logar
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        ERRORS.inc(stage='scrape')
+        if message is None:
+            # JSON invalido: tentar de novo nao adianta
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        try:
+            # Ex: MongoDB fora do ar -> tambem passa pelas filas de nova tentativa
+            schedule_retry(ch, message, e)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
 def start_worker():
     print("Iniciando Worker Scraper (MODO REAL - BF2042)...")
-    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST))
+    ensure_indexes(get_db_connection())
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=RABBITMQ_HOST, virtual_host=RABBITMQ_VHOST))
     channel = connection.channel()
     channel.queue_declare(queue=SCRAPING_QUEUE, durable=True)
+    for queue, arguments in retry_queues(SCRAPING_QUEUE):
+        channel.queue_declare(queue=queue, durable=True, arguments=arguments)
+    channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True)
     channel.basic_qos(prefetch_count=1)
     channel.basic_consume(queue=SCRAPING_QUEUE, on_message_callback=callback)
     print("Aguardando mensagens na fila scraping_queue...")
     channel.start_consuming()
 
+def start_async_worker():
+    import asyncio
+    from async_scraper import AsyncScraper
+
+    print(f"Iniciando Worker Scraper (MODO ASSINCRONO - {SCRAPER_CONCURRENCY} buscas simultaneas)...")
+    ensure_indexes(get_db_connection())
+    scraper = AsyncScraper(
+        rabbitmq_host=RABBITMQ_HOST,
+        rabbitmq_vhost=RABBITMQ_VHOST,
+        mongo_uri=MONGO_URI,
+        scraping_queue=SCRAPING_QUEUE,
+        analysis_queue=ANALYSIS_QUEUE,
+        concurrency=SCRAPER_CONCURRENCY,
+        rate_limit=SCRAPER_RATE_LIMIT,
+        rate_burst=SCRAPER_RATE_BURST,
+        db_name=MONGO_DB,
+        cache=get_cache()
+    )
+    asyncio.run(scraper.run())
+
 if __name__ == '__main__':
-    start_worker()
\ No newline at end of file
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"Metricas em http://localhost:{METRICS_PORT}/metrics")
+    if SCRAPER_MODE == 'async' or '--async' in sys.argv:
+        start_async_worker()
+    else:
+        start_worker()
\ No newline at end of file
@@ -0,0 +1,47 @@
+import os
+import time
+
+# Buscas que falham por motivo passageiro (HTTP 5xx/429, timeout, conexao) voltam
+# para a scraping_queue depois de um atraso que dobra a cada tentativa.
+# Cada tentativa tem sua propria fila de espera com TTL fixo: quando a mensagem
+# expira, o RabbitMQ a devolve (dead-letter) para a scraping_queue. Com um TTL por
+# fila, uma mensagem com atraso longo nunca segura as de atraso curto.
+RETRY_BASE_SECONDS = float(os.environ.get('SCRAPER_RETRY_BASE_SECONDS', 5))
+MAX_RETRIES = int(os.environ.get('SCRAPER_MAX_RETRIES', 5))
+# Mensagens que esgotaram as tentativas ficam aqui para inspecao manual
+DEAD_LETTER_QUEUE = 'scraping_dead_letter'
+
+
+class TransientFetchError(Exception):
+    """Falha da GameTools que vale tentar de novo (diferente de jogador inexistente)"""
+
+
+def retry_delay(attempt):
+    return RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+
+def retry_queue_name(scraping_queue, attempt):
+    return f"{scraping_queue}.retry.{attempt}"
+
+def retry_queues(scraping_queue):
+    """(nome, arguments) de cada fila de espera, para o queue_declare"""
+    return [
+        (retry_queue_name(scraping_queue, attempt), {
+            "x-message-ttl": int(retry_delay(attempt) * 1000),
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": scraping_queue,
+        })
+        for attempt in range(1, MAX_RETRIES + 1)
+    ]
+
+def next_route(scraping_queue, message, error):
+    """
+    Decide para onde a mensagem que falhou vai: a fila de espera da proxima
+    tentativa ou, esgotadas as tentativas, a DEAD_LETTER_QUEUE.
+    Retorna (fila, mensagem atualizada).
+    """
+    attempt = int(message.get('attempt', 0)) + 1
+    message = dict(message, attempt=attempt, last_error=str(error))
+    if attempt > MAX_RETRIES:
+        message['failed_at'] = time.time()
+        return DEAD_LETTER_QUEUE, message
+    return retry_queue_name(scraping_queue, attempt), message
@@ -0,0 +1,28 @@
+from pymongo.errors import DuplicateKeyError
+
+# Ponteiro para o snapshot mais recente de cada jogador (_id = player_name).
+# O campo 'version' sobe a cada snapshot novo e a cada analise concluida:
+# a API usa esse valor para invalidar seu cache e gerar o ETag.
+LATEST_COLLECTION = 'player_latest'
+
+def save_snapshot(db, data):
+    """Salva o snapshot em raw_player_stats, atualiza o ponteiro do jogador e retorna o _id"""
+    result = db['raw_player_stats'].insert_one(data)
+    try:
+        # O filtro por created_at evita voltar o ponteiro para um snapshot mais antigo
+        db[LATEST_COLLECTION].update_one(
+            {"_id": data['player_name'], "created_at": {"$lte": data['created_at']}},
+            {
+                "$set": {
+                    "document_id": result.inserted_id,
+                    "platform": data.get('platform'),
+                    "created_at": data['created_at']
+                },
+                "$inc": {"version": 1}
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Ja existe um snapshot mais novo apontado
+        pass
+    return result.inserted_id